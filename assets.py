@@ -0,0 +1,165 @@
+import base64
+import mimetypes
+import mmap
+import os
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+# Origin the pages are loaded from. Requests to it are answered straight from
+# `data/` by the browser manager, so no separate static server is needed.
+ASSET_BASE_URL = "http://localhost:8000"
+DATA_DIR = "data"
+
+# Types missing from some platforms' mimetypes tables
+CONTENT_TYPES = {
+    ".avif": "image/avif",
+    ".webp": "image/webp",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".svg": "image/svg+xml",
+}
+
+
+def content_type(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in CONTENT_TYPES:
+        return CONTENT_TYPES[ext]
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+class BoundedLRU:
+    """
+    LRU cache bounded by the total size of its values. Subclasses count hits
+    and misses, and override `_size` for values other than bytes and strings.
+    """
+
+    # Printed by print_stats: prefix, name of the entries and of their size
+    STATS = ("[cache]", "entries", "cached")
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _size(self, value):
+        return len(value)
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= self._size(previous)
+        self._entries[key] = value
+        self.size += self._size(value)
+
+        # Evict least recently used entries, but always keep the one just added
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= self._size(evicted)
+
+    def print_stats(self):
+        prefix, entries, size = self.STATS
+        print(f"{prefix} {entries}: {len(self._entries)}, {size}: {self.size / 1024 / 1024:.1f}MB, hits: {self.hits}, misses: {self.misses}")
+
+
+class AssetCache(BoundedLRU):
+    """
+    LRU cache of file contents served to the browser, bounded by total size.
+
+    Entries are keyed by path and revalidated against mtime and size, so edited
+    files are picked up while unchanged fonts and images are read only once.
+    """
+
+    STATS = ("[assets]", "files", "cached")
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        super().__init__(max_bytes)
+
+    def _size(self, entry):
+        return len(entry[1])
+
+    def read(self, path):
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self.get(path)
+        if entry and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        with open(path, "rb") as f:
+            body = f.read()
+
+        self.put(path, (version, body))
+        return body
+
+
+asset_cache = AssetCache()
+
+
+def resolve_asset_path(url):
+    """Map a request URL under ASSET_BASE_URL to a file in `data/`, or None if it's outside of it."""
+    rel_path = unquote(urlsplit(url).path).lstrip("/")
+    data_dir = os.path.abspath(DATA_DIR)
+    path = os.path.abspath(os.path.join(data_dir, rel_path))
+    if not path.startswith(data_dir + os.sep):
+        return None
+    return path
+
+
+async def fulfill_from_disk(route):
+    """Playwright route handler answering asset requests from `data/` through the asset cache."""
+    path = resolve_asset_path(route.request.url)
+
+    if path is None or not os.path.isfile(path):
+        await route.fulfill(status=404, body="Not found")
+        return
+
+    await route.fulfill(status=200, body=asset_cache.read(path), content_type=content_type(path))
+
+
+class DataUrlCache(BoundedLRU):
+    """
+    LRU cache of base64 data URLs of images, bounded by total size.
+
+    Entries are keyed by path, mtime and size, so every image is read (through
+    mmap) and encoded once per process, however many prompts include it.
+    """
+
+    STATS = ("[images]", "encoded", "memory")
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        super().__init__(max_bytes)
+
+    def data_url(self, path, mime_type=None):
+        stat = os.stat(path)
+        mime_type = mime_type or content_type(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, mime_type)
+
+        url = self.get(key)
+        if url is not None:
+            self.hits += 1
+            return url
+
+        self.misses += 1
+        with open(path, "rb") as f:
+            if stat.st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    encoded = base64.b64encode(data).decode("ascii")
+            else:
+                encoded = ""
+        url = f"data:{mime_type};base64,{encoded}"
+
+        self.put(key, url)
+        return url
+
+
+data_url_cache = DataUrlCache()
@@ -0,0 +1,222 @@
+from typing import Callable, Sequence
+import numpy as np
+from css_properties import (
+    COLOR_TOLERANCE,
+    NUMERIC_TOLERANCE,
+    aspect_ratio_evaluator,
+    color_evaluator,
+    css_properties,
+    exact_match_evaluator,
+    extract_numeric_value,
+    grid_template_evaluator,
+    numeric_evaluator,
+    parse_aspect_ratio,
+    parse_hex,
+    parse_rgb,
+)
+
+# Batch scoring of css_properties evaluators with NumPy.
+#
+# Every batch evaluator takes columns of reference and corrected values plus an
+# array of tolerances, and returns a (tolerances, values) boolean array with
+# exactly the results of the scalar evaluator for each tolerance. Values are
+# parsed with the scalar helpers (once per distinct string), so parsing errors
+# are raised the same way too.
+
+
+def _parse_unique(values: Sequence[str], parse: Callable) -> np.ndarray:
+    # Parse every distinct value once and spread the results back over the column
+    unique, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    parsed = np.array([parse(str(value)) for value in unique], dtype=float)
+    return parsed[inverse.reshape(-1)]
+
+
+def _relative_within(reference: np.ndarray, new: np.ndarray, tolerances: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.abs(reference - new) / reference
+    return relative[None, :] <= tolerances[:, None]
+
+
+def batch_numeric(references, news, tolerances) -> np.ndarray:
+    """numeric_evaluator over columns of values"""
+    reference = _parse_unique(references, extract_numeric_value)
+    new = _parse_unique(news, extract_numeric_value)
+
+    within = _relative_within(reference, new, tolerances)
+    zero = reference == 0
+    return np.where(zero[None, :], (new == 0)[None, :], within)
+
+
+def _rgb_to_hsv(rgb: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # colorsys.rgb_to_hsv, operation for operation
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    rangec = maxc - minc
+    grey = minc == maxc
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = rangec / maxc
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.mod(h / 6.0, 1.0)
+
+    return np.where(grey, 0.0, h), np.where(grey, 0.0, s), maxc
+
+
+def _parse_color(color: str) -> tuple[float, float, float]:
+    rgb = parse_rgb(color) if color.startswith('rgb') else parse_hex(color)
+    return tuple(x / 255.0 for x in rgb)
+
+
+def batch_color(references, news, tolerances) -> np.ndarray:
+    """color_evaluator over columns of values"""
+    equal = np.asarray(references, dtype=object) == np.asarray(news, dtype=object)
+    result = np.broadcast_to(equal, (len(tolerances), len(equal))).copy()
+
+    # Like the scalar evaluator, only colors that differ are parsed
+    differing = np.flatnonzero(~equal)
+    if len(differing) == 0:
+        return result
+
+    rgb1 = _parse_unique([references[i] for i in differing], _parse_color)
+    rgb2 = _parse_unique([news[i] for i in differing], _parse_color)
+    h1, s1, v1 = _rgb_to_hsv(rgb1)
+    h2, s2, v2 = _rgb_to_hsv(rgb2)
+
+    h_diff = np.minimum(np.abs(h1 - h2), 1 - np.abs(h1 - h2)) * 2
+    s_diff = np.abs(s1 - s2)
+    v_diff = np.abs(v1 - v2)
+    distance = np.sqrt(h_diff**2 + s_diff**2 + v_diff**2)
+
+    result[:, differing] = distance[None, :] <= tolerances[:, None]
+    return result
+
+
+def batch_aspect_ratio(references, news, tolerances) -> np.ndarray:
+    """aspect_ratio_evaluator over columns of values"""
+    reference = _parse_unique(references, parse_aspect_ratio)
+    new = _parse_unique(news, parse_aspect_ratio)
+
+    if np.any(reference == 0):
+        raise ZeroDivisionError("float division by zero")
+
+    return _relative_within(reference, new, tolerances)
+
+
+def batch_exact_match(references, news, tolerances) -> np.ndarray:
+    """exact_match_evaluator over columns of values, tolerances don't apply"""
+    equal = np.asarray(references, dtype=object) == np.asarray(news, dtype=object)
+    return np.broadcast_to(equal.astype(bool), (len(tolerances), len(equal)))
+
+
+def batch_grid_template(references, news, tolerances) -> np.ndarray:
+    """grid_template_evaluator over columns of values"""
+    result = np.zeros((len(tolerances), len(references)), dtype=bool)
+
+    ref_columns = [reference.strip().split() for reference in references]
+    new_columns = [new.strip().split() for new in news]
+
+    # Values with a different number of columns fail, the rest are scored column by column
+    rows = [i for i in range(len(references)) if len(ref_columns[i]) == len(new_columns[i])]
+    empty = [i for i in rows if not ref_columns[i]]
+    scored = [i for i in rows if ref_columns[i]]
+    result[:, empty] = True
+
+    if scored:
+        flat_references = [column for i in scored for column in ref_columns[i]]
+        flat_news = [column for i in scored for column in new_columns[i]]
+        starts = np.cumsum([0] + [len(ref_columns[i]) for i in scored[:-1]])
+
+        columns_ok = batch_numeric(flat_references, flat_news, tolerances)
+        result[:, scored] = np.logical_and.reduceat(columns_ok, starts, axis=1)
+
+    return result
+
+
+BATCH_EVALUATORS = {
+    numeric_evaluator: (batch_numeric, "numeric"),
+    color_evaluator: (batch_color, "color"),
+    aspect_ratio_evaluator: (batch_aspect_ratio, "numeric"),
+    exact_match_evaluator: (batch_exact_match, None),
+    grid_template_evaluator: (batch_grid_template, "numeric"),
+}
+
+
+def score_batch(
+    properties: Sequence[str],
+    references: Sequence[str],
+    news: Sequence[str],
+    numeric_tolerances: Sequence[float] = (NUMERIC_TOLERANCE,),
+    color_tolerances: Sequence[float] = (COLOR_TOLERANCE,),
+) -> np.ndarray:
+    """
+    Score rows of (CSS property, reference value, corrected value) over a grid of tolerances.
+
+    Rows are grouped by their property's evaluator and each group is scored
+    in one vectorized pass. Returns a boolean array of shape
+    (len(numeric_tolerances), len(color_tolerances), len(properties)) where
+    [i, j, k] is what the scalar evaluator of row k returns with numeric
+    tolerance i and color tolerance j.
+    """
+    numeric_tolerances = np.asarray(numeric_tolerances, dtype=float)
+    color_tolerances = np.asarray(color_tolerances, dtype=float)
+    result = np.zeros((len(numeric_tolerances), len(color_tolerances), len(properties)), dtype=bool)
+
+    groups = {}
+    for i, prop in enumerate(properties):
+        evaluator = css_properties.get(prop)
+        if evaluator is None:
+            raise ValueError(f"No evaluator defined for CSS property '{prop}'")
+        if evaluator not in BATCH_EVALUATORS:
+            raise ValueError(f"No batch version of the evaluator of CSS property '{prop}'")
+        groups.setdefault(evaluator, []).append(i)
+
+    for evaluator, rows in groups.items():
+        group_references = [references[i] for i in rows]
+        group_news = [news[i] for i in rows]
+
+        batch_evaluator, tolerance_kind = BATCH_EVALUATORS[evaluator]
+        if tolerance_kind == "color":
+            result[:, :, rows] = batch_evaluator(group_references, group_news, color_tolerances)[None, :, :]
+        elif tolerance_kind == "numeric":
+            result[:, :, rows] = batch_evaluator(group_references, group_news, numeric_tolerances)[:, None, :]
+        else:
+            result[:, :, rows] = batch_evaluator(group_references, group_news, np.zeros(1))[0]
+
+    return result
+
+
+def score_responses(responses) -> list[dict]:
+    """
+    Evaluator results of the changed properties of many responses, scored with
+    a single score_batch call.
+
+    `responses` are (response_css_changes, reference_computed, corrected_computed)
+    tuples. Returns one {(selector, property): bool} per response, to pass to
+    run_eval.score_response as `scores`. Properties without an evaluator or
+    without computed values are left out, score_response handles those itself.
+    """
+    owners, keys, properties, references, news = [], [], [], [], []
+    for index, (css_changes, reference_computed, corrected_computed) in enumerate(responses):
+        for selector, changed in css_changes.items():
+            for prop in changed:
+                if css_properties.get(prop) is None:
+                    continue
+                if prop not in reference_computed.get(selector, {}) or prop not in corrected_computed.get(selector, {}):
+                    continue
+                owners.append(index)
+                keys.append((selector, prop))
+                properties.append(prop)
+                references.append(reference_computed[selector][prop])
+                news.append(corrected_computed[selector][prop])
+
+    scores = [{} for _ in responses]
+    if properties:
+        passed = score_batch(properties, references, news)[0, 0]
+        for index, key, result in zip(owners, keys, passed):
+            scores[index][key] = bool(result)
+    return scores
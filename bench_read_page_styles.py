@@ -0,0 +1,79 @@
+import os
+import re
+import time
+from bs4 import BeautifulSoup
+from project_manifest import project_manifest
+from run_html import build_html
+from utils import read_page_styles
+
+ITERATIONS = 200
+
+
+def read_page_styles_bs4(html_content):
+    """Previous implementation of utils.read_page_styles, kept as a baseline"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    page_styles = soup.select_one('#page-styles')
+    if not page_styles:
+        return {}
+
+    css_text = re.sub(r'/\*.*?\*/', '', page_styles.string, flags=re.DOTALL)
+
+    stylesheet = {}
+    for selector, properties_text in re.findall(r'([^\{\}]+)\s*\{([^\{\}]*)\}', css_text):
+        selector = selector.strip()
+        if not selector:
+            continue
+
+        properties = {}
+        for prop in properties_text.split(';'):
+            prop = prop.strip()
+            if not prop:
+                continue
+            try:
+                key, value = prop.split(':', 1)
+                properties[key.strip()] = value.strip()
+            except ValueError:
+                continue
+
+        stylesheet[selector] = properties
+
+    return stylesheet
+
+
+def measure(parse, html_content):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        parse(html_content)
+    return (time.perf_counter() - start) / ITERATIONS
+
+
+def main():
+    print(f"{'Page':<20} {'Input':<10} {'Size':<8} {'bs4 (ms)':<10} {'tokenizer (ms)':<15} {'Speedup':<8}")
+    print("-" * 75)
+
+    for project_id, page_id in project_manifest.pages():
+        with open(os.path.join("data", project_id, "pages", page_id, "page.html")) as f:
+            page_html = f.read()
+
+        # page.html as read by load_config, and a full generated page as dumped by get_computed_css
+        inputs = {
+            "page.html": page_html,
+            "generated": build_html(project_id, page_id, "reference"),
+        }
+
+        for input_name, html_content in inputs.items():
+            if read_page_styles(html_content) != read_page_styles_bs4(html_content):
+                raise AssertionError(f"{project_id}.{page_id} ({input_name}): parsers returned different stylesheets")
+
+            bs4_time = measure(read_page_styles_bs4, html_content)
+            tokenizer_time = measure(read_page_styles, html_content)
+
+            print(
+                f"{project_id + '.' + page_id:<20} {input_name:<10} {len(html_content) // 1024:>4}KB   "
+                f"{bs4_time * 1000:<10.3f} {tokenizer_time * 1000:<15.3f} {bs4_time / tokenizer_time:.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
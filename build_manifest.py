@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+from utils import load_config, page_content_hash, update_file_hash
+
+# Bump when the way pages are generated or rendered changes, to rebuild everything
+BUILD_VERSION = 1
+
+# Per-project directories whose files end up in screenshots
+ASSET_DIRS = ["fonts", "images"]
+
+STAGE_ARTIFACTS = {
+    "html": "html",
+    "screenshot": "png",
+}
+
+
+# Asset hashes by project, computed once per run
+_asset_hashes = {}
+
+def project_assets_hash(project_id):
+    """Hash of all fonts and images of a project"""
+    if project_id not in _asset_hashes:
+        content_hash = hashlib.sha256()
+        for asset_dir in ASSET_DIRS:
+            asset_path = os.path.join("data", project_id, asset_dir)
+            for root, dirs, files in os.walk(asset_path):
+                dirs.sort()
+                for file in sorted(files):
+                    update_file_hash(content_hash, os.path.join(root, file))
+        _asset_hashes[project_id] = content_hash.hexdigest()
+    return _asset_hashes[project_id]
+
+
+def artifact_input_hash(project_id, page_id, variant_id, stage, css_changes=None):
+    """
+    Hash of the inputs of an artifact: the page's inputs (utils.page_content_hash)
+    and the variant's css_changes, plus fonts and images for screenshots.
+    """
+    content_hash = hashlib.sha256()
+    content_hash.update(f"{BUILD_VERSION}\0{stage}\0{variant_id}\0".encode("utf-8"))
+
+    content_hash.update(page_content_hash(project_id, page_id).encode("utf-8"))
+    content_hash.update(json.dumps(css_changes, sort_keys=True).encode("utf-8"))
+
+    if stage == "screenshot":
+        content_hash.update(project_assets_hash(project_id).encode("utf-8"))
+
+    return content_hash.hexdigest()
+
+
+def artifact_name(variant_id, stage):
+    """Artifact path relative to the page's `generated/` directory"""
+    extension = STAGE_ARTIFACTS[stage]
+    if variant_id == "reference":
+        return f"reference.{extension}"
+    return f"{variant_id}/page.{extension}"
+
+
+class BuildManifest:
+    """
+    Input hashes of the generated artifacts of a page, stored in `generated/manifest.json`.
+
+    An artifact is up to date when it exists and was built from inputs with the
+    same hash as the current ones.
+    """
+
+    def __init__(self, project_id, page_id):
+        self.generated_dir = os.path.join("data", project_id, "pages", page_id, "generated")
+        self.path = os.path.join(self.generated_dir, "manifest.json")
+        self.artifacts = {}
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.artifacts = json.load(f).get("artifacts", {})
+            except json.JSONDecodeError:
+                pass
+
+    def is_fresh(self, artifact, input_hash):
+        return self.artifacts.get(artifact) == input_hash and os.path.exists(os.path.join(self.generated_dir, artifact))
+
+    def record(self, artifact, input_hash):
+        self.artifacts[artifact] = input_hash
+        self.save()
+
+    def save(self):
+        os.makedirs(self.generated_dir, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({"version": BUILD_VERSION, "artifacts": self.artifacts}, f, indent=2, sort_keys=True)
+
+
+_manifests = {}
+
+def get_manifest(project_id, page_id) -> BuildManifest:
+    if (project_id, page_id) not in _manifests:
+        _manifests[(project_id, page_id)] = BuildManifest(project_id, page_id)
+    return _manifests[(project_id, page_id)]
+
+
+def plan_builds(testcases, stage, force=False):
+    """
+    Split (project_id, page_id, variant_id) test cases into the ones whose
+    artifact for `stage` is stale and the ones that are up to date.
+
+    Returns (stale, fresh), where stale items carry the input hash to record
+    with `record_build` once the artifact is built.
+    """
+    stale = []
+    fresh = []
+    for project_id, page_id, variant_id in testcases:
+        css_changes = None
+        if variant_id != "reference":
+            css_changes = load_config(project_id, page_id).get_variant(variant_id).css_changes
+
+        input_hash = artifact_input_hash(project_id, page_id, variant_id, stage, css_changes)
+        artifact = artifact_name(variant_id, stage)
+
+        if not force and get_manifest(project_id, page_id).is_fresh(artifact, input_hash):
+            fresh.append((project_id, page_id, variant_id))
+        else:
+            stale.append((project_id, page_id, variant_id, input_hash))
+
+    return stale, fresh
+
+
+def record_build(project_id, page_id, variant_id, stage, input_hash):
+    get_manifest(project_id, page_id).record(artifact_name(variant_id, stage), input_hash)
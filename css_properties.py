@@ -6,15 +6,18 @@ import math
 NUMERIC_TOLERANCE = 0.25
 COLOR_TOLERANCE = 0.25
 
+NUMERIC_PATTERN = re.compile(r'(\d+\.?\d*)')
+RGB_PATTERN = re.compile(r'rgb\((\d+),\s*(\d+),\s*(\d+)\)')
+
 # Helper functions
 def extract_numeric_value(value: str) -> float:
     """Extract numeric value from CSS value string (e.g. '16px' -> 16.0)"""
-    match = re.search(r'(\d+\.?\d*)', value)
+    match = NUMERIC_PATTERN.search(value)
     return float(match.group(1)) if match else 0.0
 
 def parse_rgb(color: str) -> tuple[int, int, int]:
     """Parse RGB color string to tuple of integers"""
-    match = re.search(r'rgb\((\d+),\s*(\d+),\s*(\d+)\)', color)
+    match = RGB_PATTERN.search(color)
     if match:
         return tuple(int(x) for x in match.groups())
     return (0, 0, 0)
@@ -1,4 +1,20 @@
+def image_parts(images):
+    # A screenshot can be sent as several tiles, top to bottom
+    if isinstance(images, str):
+        images = [images]
+
+    return [
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": image
+            }
+        }
+        for image in images
+    ]
+
 def eval_prompt(errors_count, incorrect_html, incorrect_image, correct_image):
+    """incorrect_image and correct_image are image URLs, or lists of URLs of a screenshot's tiles from top to bottom"""
     return [
         {
             "type": "text",
@@ -43,20 +59,10 @@ Here is the incorrect page HTML code (incorrect.html):
             "type": "text",
             "text": "The screenshot of incorrect page design (incorrect.html) that needs to be fixed:"
         },
-        {
-            "type": "image_url",
-            "image_url": {
-                "url": incorrect_image
-            }
-        },
+        *image_parts(incorrect_image),
         {
             "type": "text",
             "text": "The correct page design (a screenshot of correct.html):"
         },
-        {
-            "type": "image_url",
-            "image_url": {
-                "url": correct_image
-            }
-        }
+        *image_parts(correct_image)
     ]
\ No newline at end of file
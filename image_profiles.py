@@ -0,0 +1,147 @@
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+# Encoded copies live in a hidden directory next to the source image
+ENCODED_DIR = ".encoded"
+
+MIME_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+EXTENSIONS = {
+    "png": "png",
+    "webp": "webp",
+    "jpeg": "jpg",
+}
+
+
+@dataclass(frozen=True)
+class ImageProfile:
+    """
+    How screenshots are encoded for prompts.
+
+    `max_dimension` caps the longest side of every image sent. With `tile`,
+    only the width is capped and the page is cut from top to bottom into
+    tiles that are at most `max_dimension` tall.
+    """
+
+    name: str
+    format: str = "png"
+    quality: Optional[int] = None
+    max_dimension: Optional[int] = None
+    tile: bool = False
+
+    @property
+    def is_original(self) -> bool:
+        return self.format == "png" and self.max_dimension is None and not self.tile
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.format]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+IMAGE_PROFILES = {
+    profile.name: profile
+    for profile in [
+        # Full resolution PNG as rendered, no re-encoding
+        ImageProfile("original"),
+        ImageProfile("png-1024", "png", max_dimension=1024),
+        ImageProfile("webp", "webp", quality=85, max_dimension=1536),
+        ImageProfile("webp-1024", "webp", quality=80, max_dimension=1024),
+        ImageProfile("webp-tiled", "webp", quality=85, max_dimension=1536, tile=True),
+        ImageProfile("jpeg", "jpeg", quality=85, max_dimension=1536),
+        ImageProfile("jpeg-tiled", "jpeg", quality=85, max_dimension=1536, tile=True),
+    ]
+}
+
+DEFAULT_IMAGE_PROFILE = "original"
+
+
+def get_image_profile(name: str) -> ImageProfile:
+    if name not in IMAGE_PROFILES:
+        raise ValueError(f"Unknown image profile '{name}', available: {', '.join(IMAGE_PROFILES)}")
+    return IMAGE_PROFILES[name]
+
+
+def _encode(source_path: str, profile: ImageProfile, output_base: str) -> List[str]:
+    # Pillow is only needed for profiles that re-encode screenshots
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        image.load()
+
+    width, height = image.size
+    if profile.max_dimension:
+        longest = width if profile.tile else max(width, height)
+        if longest > profile.max_dimension:
+            scale = profile.max_dimension / longest
+            image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+    if profile.format == "jpeg" and image.mode != "RGB":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A") if "A" in image.getbands() else None)
+        image = background
+
+    if profile.tile and profile.max_dimension:
+        tiles = [
+            image.crop((0, top, image.width, min(top + profile.max_dimension, image.height)))
+            for top in range(0, image.height, profile.max_dimension)
+        ]
+    else:
+        tiles = [image]
+
+    save_options = {"quality": profile.quality} if profile.quality is not None else {}
+    extension = EXTENSIONS[profile.format]
+
+    paths = []
+    for i, tile in enumerate(tiles):
+        path = f"{output_base}.{i}.{extension}" if len(tiles) > 1 else f"{output_base}.{extension}"
+        tile.save(path, format=profile.format.upper(), **save_options)
+        paths.append(path)
+
+    return paths
+
+
+def encode_image(source_path: str, profile: ImageProfile) -> List[str]:
+    """
+    Paths of the image(s) to send for `source_path` with `profile`, top to bottom.
+
+    Encoded files are cached in `.encoded/` next to the source together with
+    an index of the source's mtime and size and the profile, and are only
+    re-encoded when one of those changes.
+    """
+    if profile.is_original:
+        return [source_path]
+
+    source_dir, source_name = os.path.split(source_path)
+    encoded_dir = os.path.join(source_dir, ENCODED_DIR)
+    output_base = os.path.join(encoded_dir, f"{os.path.splitext(source_name)[0]}-{profile.name}")
+    index_path = f"{output_base}.json"
+
+    stat = os.stat(source_path)
+    source = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, "r") as f:
+                index = json.load(f)
+            paths = [os.path.join(encoded_dir, name) for name in index["files"]]
+            if index["source"] == source and index["profile"] == profile.to_dict() and all(os.path.exists(path) for path in paths):
+                return paths
+        except (json.JSONDecodeError, KeyError):
+            pass
+
+    os.makedirs(encoded_dir, exist_ok=True)
+    paths = _encode(source_path, profile, output_base)
+
+    with open(index_path, "w") as f:
+        json.dump({"source": source, "profile": profile.to_dict(), "files": [os.path.basename(path) for path in paths]}, f, indent=2)
+
+    return paths
@@ -0,0 +1,182 @@
+"""
+Local stand-in for the OpenRouter chat completions API, for timing and
+regression-testing the benchmarks offline.
+
+    python mock_server.py --latency 2 --rate-limit-rate 0.1
+    OPENROUTER_BASE_URL=http://localhost:8001/v1 python run.py eval glossier --model openai/gpt-4o
+
+By default every request gets a canned reply that both benchmarks parse
+(no CSS changes, all labels correct) after the configured latency, and
+requests fail with a 500 or a 429 (with Retry-After) at the configured
+rates. Which requests fail is decided from a hash of the request and the
+seed, so a run is reproducible regardless of request order.
+
+With --record DIR, requests are forwarded to --upstream and the successful
+responses are saved as a cassette in DIR. Requests already in the cassette
+are answered from it. With --replay DIR, only the cassette is used and
+unknown requests get a 404.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from aiohttp import ClientSession, ClientTimeout, web
+
+UPSTREAM_URL = "https://openrouter.ai/api/v1"
+
+DEFAULT_REPLY = {
+    "reasoning": "Stand-in reply from the local mock server.",
+    "css_changes": {},
+    "all_labels_correct": True,
+}
+
+
+def request_key(body: dict) -> str:
+    """Cassette key of a request: everything that affects the reply"""
+    payload = json.dumps({"model": body.get("model"), "messages": body.get("messages")}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def error_response(status, message, headers=None):
+    return web.json_response({"error": {"code": status, "message": message}}, status=status, headers=headers)
+
+
+def completion(model, content):
+    return {
+        "id": f"mock-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class MockServer:
+    def __init__(self, latency=0.0, latency_jitter=0.0, failure_rate=0.0, rate_limit_rate=0.0, retry_after=1.0,
+                 seed=0, record=None, replay=None, upstream=UPSTREAM_URL):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.cassette_dir = record or replay
+        self.recording = record is not None
+        self.upstream = upstream.rstrip("/")
+
+        # Attempts seen per request key, so retries of a failed request get a fresh draw
+        self._attempts = defaultdict(int)
+        self._upstream_session = None
+        self.stats = defaultdict(int)
+
+    def _draw(self, key, attempt, purpose):
+        """Deterministic number in [0, 1) for a request attempt"""
+        digest = hashlib.sha256(f"{self.seed}:{key}:{attempt}:{purpose}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2**64
+
+    def _cassette_path(self, key):
+        return os.path.join(self.cassette_dir, f"{key}.json")
+
+    async def _forward(self, request, body):
+        if self._upstream_session is None:
+            self._upstream_session = ClientSession(timeout=ClientTimeout(total=600))
+
+        headers = {"Content-Type": "application/json"}
+        if "Authorization" in request.headers:
+            headers["Authorization"] = request.headers["Authorization"]
+
+        async with self._upstream_session.post(f"{self.upstream}/chat/completions", json=body, headers=headers) as response:
+            return response.status, await response.json(content_type=None)
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        key = request_key(body)
+        attempt = self._attempts[key]
+        self._attempts[key] += 1
+        self.stats["requests"] += 1
+
+        if self.cassette_dir:
+            path = self._cassette_path(key)
+            if os.path.exists(path):
+                self.stats["replayed"] += 1
+                with open(path, "r", encoding="utf-8") as f:
+                    return web.json_response(json.load(f))
+
+            if not self.recording:
+                self.stats["missing"] += 1
+                return error_response(404, f"Request {key} is not in the cassette")
+
+            status, data = await self._forward(request, body)
+            if status == 200 and "error" not in data:
+                self.stats["recorded"] += 1
+                os.makedirs(self.cassette_dir, exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2)
+            return web.json_response(data, status=status)
+
+        delay = self.latency + self.latency_jitter * (2 * self._draw(key, attempt, "latency") - 1)
+        await asyncio.sleep(max(0.0, delay))
+
+        if self._draw(key, attempt, "rate_limit") < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            return error_response(429, "Rate limit exceeded (mock)", headers={"Retry-After": f"{self.retry_after:g}"})
+
+        if self._draw(key, attempt, "failure") < self.failure_rate:
+            self.stats["failed"] += 1
+            return error_response(500, "Internal server error (mock)")
+
+        self.stats["replied"] += 1
+        return web.json_response(completion(body.get("model"), json.dumps(DEFAULT_REPLY)))
+
+    async def close(self, app=None):
+        if self._upstream_session is not None:
+            await self._upstream_session.close()
+        print(f"[mock] {dict(self.stats)}")
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/api/v1/chat/completions", self.chat_completions)
+        app.on_cleanup.append(self.close)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI compatible stand-in server")
+    parser.add_argument("--port", type=int, default=8001, help="Port to listen on (default: 8001)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before every reply (default: 0)")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Replies take latency +/- up to this many seconds (default: 0)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with a 500 (default: 0)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with a 429 (default: 0)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the latency and failure draws (default: 0)")
+    parser.add_argument("--record", metavar="DIR", help="Forward requests to --upstream and save the responses in DIR")
+    parser.add_argument("--replay", metavar="DIR", help="Answer requests only from responses saved in DIR")
+    parser.add_argument("--upstream", default=UPSTREAM_URL, help=f"API to record from (default: {UPSTREAM_URL})")
+    args = parser.parse_args()
+
+    if args.record and args.replay:
+        parser.error("--record and --replay can't be used together")
+
+    server = MockServer(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        failure_rate=args.failure_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+        record=args.record,
+        replay=args.replay,
+        upstream=args.upstream,
+    )
+    print(f"[mock] listening on http://localhost:{args.port}/v1")
+    web.run_app(server.app(), port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
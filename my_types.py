@@ -1,10 +1,125 @@
-from typing import Dict, List, Optional
+import hashlib
+import json
+from collections import ChainMap
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel, model_validator
 from css_properties import css_properties
 
 StyleSheet = Dict[str, Dict[str, str]]
 
 
+# Fingerprints of base stylesheets by id, holding a reference so the id stays valid
+_base_fingerprints = {}
+
+def _stylesheet_fingerprint(stylesheet: StyleSheet) -> str:
+    cached = _base_fingerprints.get(id(stylesheet))
+    if cached is None or cached[0] is not stylesheet:
+        digest = hashlib.sha256(json.dumps(stylesheet).encode("utf-8")).hexdigest()
+        cached = (stylesheet, digest)
+        _base_fingerprints[id(stylesheet)] = cached
+    return cached[1]
+
+
+class LayeredStyleSheet(Mapping):
+    """
+    Read-only stylesheet made of change sets stacked on top of a base, without copying any of them.
+
+    Later layers win. Selectors and properties iterate in the same order as
+    if the layers were applied one by one to a copy of the base with
+    dict.update(), so the generated CSS is the same.
+    """
+
+    def __init__(self, base: StyleSheet, *layers: StyleSheet):
+        # Stacking on another layered stylesheet shares its base
+        if isinstance(base, LayeredStyleSheet):
+            layers = base.layers + layers
+            base = base.base
+
+        self.base = base
+        self.layers = tuple(layers)
+
+    def __getitem__(self, selector: str) -> Mapping:
+        maps = [layer[selector] for layer in reversed(self.layers) if selector in layer]
+        if selector in self.base:
+            maps.append(self.base[selector])
+        if not maps:
+            raise KeyError(selector)
+        return MappingProxyType(ChainMap(*maps))
+
+    def __iter__(self):
+        selectors = dict.fromkeys(self.base)
+        for layer in self.layers:
+            selectors.update(dict.fromkeys(layer))
+        return iter(selectors)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def value(self, selector: str, prop: str) -> Optional[str]:
+        for layer in reversed(self.layers):
+            if prop in layer.get(selector, {}):
+                return layer[selector][prop]
+        return self.base.get(selector, {}).get(prop)
+
+    def overrides(self) -> Dict[Tuple[str, str], str]:
+        """
+        (selector, property) -> value for everything the layers change on top of the base.
+
+        Values equal to the base are left out. Overrides of existing properties
+        are sorted, since their position comes from the base. New properties
+        keep the order in which they were added, which is also their order in
+        the stylesheet.
+        """
+        changed = {}
+        for layer in self.layers:
+            for selector, properties in layer.items():
+                for prop, value in properties.items():
+                    changed[(selector, prop)] = value
+
+        existing = {}
+        added = {}
+        for (selector, prop), value in changed.items():
+            base_properties = self.base.get(selector, {})
+            if prop not in base_properties:
+                added[(selector, prop)] = value
+            elif base_properties[prop] != value:
+                existing[(selector, prop)] = value
+
+        return {**dict(sorted(existing.items())), **added}
+
+    def fingerprint(self) -> str:
+        """Hash of the resulting stylesheet, computed from the base's hash and the overrides only"""
+        overrides = [[selector, prop, value] for (selector, prop), value in self.overrides().items()]
+        payload = json.dumps([_stylesheet_fingerprint(self.base), overrides])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def diff(self, other: "LayeredStyleSheet") -> Dict[Tuple[str, str], Tuple[Optional[str], Optional[str]]]:
+        """(selector, property) -> (value here, value in other) for every property that differs"""
+        if self.base is other.base:
+            # Only overridden properties can differ
+            keys = dict.fromkeys(list(self.overrides()) + list(other.overrides()))
+        else:
+            keys = dict.fromkeys(
+                (selector, prop)
+                for stylesheet in (self, other)
+                for selector in stylesheet
+                for prop in stylesheet[selector]
+            )
+
+        differences = {}
+        for selector, prop in keys:
+            ours, theirs = self.value(selector, prop), other.value(selector, prop)
+            if ours != theirs:
+                differences[(selector, prop)] = (ours, theirs)
+        return differences
+
+    def materialize(self) -> StyleSheet:
+        """The resulting stylesheet as plain dicts, e.g. for code that modifies it"""
+        return {selector: dict(properties) for selector, properties in self.items()}
+
+
 
 class Variant(BaseModel):
     id: str
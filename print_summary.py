@@ -1,6 +1,6 @@
 import os
 import json
-from utils import load_config
+from project_manifest import project_manifest
 
 def print_summary():
     # Define the models we want to track
@@ -9,59 +9,43 @@ def print_summary():
     # Initialize results dictionary
     results = {model: {"passed": 0, "failed": 0, "total": 0} for model in models}
     
-    # Walk through the data directory
-    for project_id in os.listdir("data"):
-        project_path = os.path.join("data", project_id)
-        
-        # Skip if not a directory
-        if not os.path.isdir(project_path):
-            continue
-            
-        pages_path = os.path.join(project_path, "pages")
-        if not os.path.isdir(pages_path):
+    # Go through every page in the data directory
+    for project_id, section_id in project_manifest.pages():
+        section_path = os.path.join("data", project_id, "pages", section_id)
+
+        # Load variants for this section
+        try:
+            variants = project_manifest.variants(project_id, section_id)
+        except Exception as e:
+            print(f"Error loading config for {project_id}.{section_id}: {e}")
             continue
+
+        # Process each variant
+        for variant in variants:
+            variant_id = variant.variant_id
             
-        # Iterate through sections
-        for section_id in os.listdir(pages_path):
-            section_path = os.path.join(pages_path, section_id)
-            
-            # Skip if not a directory
-            if not os.path.isdir(section_path):
-                continue
-                
-            # Load config for this section
-            try:
-                config = load_config(project_id, section_id)
+            # Check results for each model
+            for model in models:
+                result_path = os.path.join(section_path, "generated", variant_id, model, "result.json")
                 
-                # Process each variant
-                for variant in config.variants:
-                    variant_id = variant.id
+                # Skip if result file doesn't exist
+                if not os.path.exists(result_path):
+                    continue
                     
-                    # Check results for each model
-                    for model in models:
-                        result_path = os.path.join(section_path, "generated", variant_id, model, "result.json")
+                # Read and process result
+                try:
+                    with open(result_path, 'r') as f:
+                        result_data = json.load(f)
                         
-                        # Skip if result file doesn't exist
-                        if not os.path.exists(result_path):
-                            continue
-                            
-                        # Read and process result
-                        try:
-                            with open(result_path, 'r') as f:
-                                result_data = json.load(f)
-                                
-                            # Update statistics
-                            results[model]["total"] += 1
-                            if result_data.get("passed", False):
-                                results[model]["passed"] += 1
-                            else:
-                                results[model]["failed"] += 1
-                                
-                        except Exception as e:
-                            print(f"Error processing result for {project_id}.{section_id}.{variant_id}.{model}: {e}")
-                
-            except Exception as e:
-                print(f"Error loading config for {project_id}.{section_id}: {e}")
+                    # Update statistics
+                    results[model]["total"] += 1
+                    if result_data.get("passed", False):
+                        results[model]["passed"] += 1
+                    else:
+                        results[model]["failed"] += 1
+                        
+                except Exception as e:
+                    print(f"Error processing result for {project_id}.{section_id}.{variant_id}.{model}: {e}")
     
     # Print summary
     print("\n===== EVALUATION SUMMARY =====")
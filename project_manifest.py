@@ -0,0 +1,106 @@
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from css_properties import css_properties
+from utils import load_config
+
+DATA_DIR = "data"
+
+
+@dataclass(frozen=True)
+class VariantEntry:
+    project_id: str
+    page_id: str
+    variant_id: str
+    # (selector, property) pairs changed by the variant
+    properties: Tuple[Tuple[str, str], ...]
+
+    @property
+    def testcase(self) -> Tuple[str, str, str]:
+        return (self.project_id, self.page_id, self.variant_id)
+
+
+def evaluator_kind(prop: str) -> Optional[str]:
+    """Short name of the evaluator of a CSS property, e.g. 'color' for color_evaluator"""
+    evaluator = css_properties.get(prop)
+    if evaluator is None:
+        return None
+    return evaluator.__name__.removesuffix("_evaluator")
+
+
+class ProjectManifest:
+    """
+    Index of every project, page, variant and changed property in `data/`.
+
+    Pages are discovered once and their configs come from the memoized
+    load_config, so the index is revalidated when page.html or config.json
+    change. Use `select` to filter variants instead of walking `data/`.
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self._pages = None
+
+    def pages(self, project_id: Optional[str] = None) -> List[Tuple[str, str]]:
+        """All (project_id, page_id) pairs that have a config.json, sorted"""
+        if self._pages is None:
+            pages = []
+            for project in sorted(os.listdir(self.data_dir)):
+                pages_dir = os.path.join(self.data_dir, project, "pages")
+                if not os.path.isdir(pages_dir):
+                    continue
+                for page in sorted(os.listdir(pages_dir)):
+                    if os.path.exists(os.path.join(pages_dir, page, "config.json")):
+                        pages.append((project, page))
+            self._pages = pages
+
+        return [page for page in self._pages if project_id is None or page[0] == project_id]
+
+    def projects(self) -> List[str]:
+        return list(dict.fromkeys(project_id for project_id, _ in self.pages()))
+
+    def variants(self, project_id: str, page_id: str) -> List[VariantEntry]:
+        config = load_config(project_id, page_id)
+        return [
+            VariantEntry(
+                project_id,
+                page_id,
+                variant.id,
+                tuple((selector, prop) for selector, properties in variant.css_changes.items() for prop in properties),
+            )
+            for variant in config.variants
+        ]
+
+    def select(
+        self,
+        project_id: Optional[str] = None,
+        page_id: Optional[str] = None,
+        variant_id: Optional[str] = None,
+        properties: Optional[List[str]] = None,
+        evaluator: Optional[str] = None,
+    ) -> List[VariantEntry]:
+        """
+        Variants matching all given filters.
+
+        `properties` keeps variants changing any of the given CSS properties,
+        `evaluator` keeps variants changing any property scored by that
+        evaluator kind (e.g. 'color', 'numeric', 'exact_match').
+        """
+        selected = []
+        for project, page in self.pages(project_id):
+            if page_id is not None and page != page_id:
+                continue
+
+            for entry in self.variants(project, page):
+                if variant_id is not None and entry.variant_id != variant_id:
+                    continue
+                if properties is not None and not any(prop in properties for _, prop in entry.properties):
+                    continue
+                if evaluator is not None and not any(evaluator_kind(prop) == evaluator for _, prop in entry.properties):
+                    continue
+                selected.append(entry)
+
+        return selected
+
+
+project_manifest = ProjectManifest()
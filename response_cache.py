@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+
+RESPONSE_CACHE_DIR = os.path.join(".cache", "responses")
+
+
+class ResponseCache:
+    """
+    Model replies stored on disk by (model, hash of the API base URL and the
+    messages), so replies of a local stand-in server never answer real runs.
+
+    The raw reply content is stored, before it's parsed, so changes to
+    parsing, rendering or scoring never need the model to be called again.
+    Only prompts that weren't sent to a model before cost a request.
+    """
+
+    def __init__(self, cache_dir=RESPONSE_CACHE_DIR, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, model, messages, base_url):
+        payload = json.dumps({"base_url": base_url.rstrip("/"), "messages": messages}, sort_keys=True, separators=(",", ":"))
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, model.replace("/", "_"), key[:2], f"{key}.json")
+
+    def get(self, model, messages, base_url):
+        """Cached reply content, or None"""
+        if not self.enabled:
+            return None
+
+        path = self.path(model, messages, base_url)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = json.load(f)["content"]
+        except (OSError, json.JSONDecodeError, KeyError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return content
+
+    def put(self, model, messages, base_url, content):
+        if not self.enabled:
+            return
+
+        path = self.path(model, messages, base_url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write next to the final path and rename, so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": model, "base_url": base_url, "content": content}, f)
+        os.replace(tmp_path, path)
+
+    def print_stats(self):
+        if not self.enabled:
+            print("[responses] cache disabled")
+            return
+        total = self.hits + self.misses
+        if total:
+            print(f"[responses] hits: {self.hits}, misses: {self.misses} ({self.hits / total:.0%} served from cache)")
+
+
+response_cache = ResponseCache()
@@ -1,73 +1,181 @@
-import json
 import os
 import argparse
-from run_html import run_html
+from run_html import run_html_timed
 from run_screenshot import run_screenshot
-from run_eval import run_eval
+from run_eval import hold_eval_prompt, run_eval
+from run_pipeline import run_pipeline
+from run_rescore import run_rescore
+from scheduler import EvalScheduler
+import utils
+from utils import browser_manager, close_openrouter_clients, print_openrouter_stats, print_timings
+from assets import asset_cache, data_url_cache
+from response_cache import response_cache
+from build_manifest import plan_builds, record_build
+from project_manifest import project_manifest
+from image_profiles import DEFAULT_IMAGE_PROFILE, IMAGE_PROFILES
 import asyncio
 import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+def parse_models(model_arg, models_file=None) -> list[str]:
+    models = [model.strip() for model in model_arg.split(',')] if model_arg else []
+
+    if models_file:
+        with open(models_file, "r") as f:
+            models += [line.split('#', 1)[0].strip() for line in f]
+
+    return list(dict.fromkeys(model for model in models if model))
 
 async def run():
     parser = argparse.ArgumentParser(description='Run evaluation')
-    parser.add_argument('command', choices=['html', 'screenshot', 'eval'], help='Command to execute')
+    parser.add_argument('command', choices=['html', 'screenshot', 'eval', 'all', 'rescore'], help='Command to execute (all = html, screenshot and eval streamed per test case, rescore = score stored responses again without calling models)')
     parser.add_argument('testcase', help='Test case')
+    parser.add_argument('--property', help='Only variants changing one of these CSS properties (comma separated)')
+    parser.add_argument('--evaluator', help='Only variants changing a property scored by this evaluator (e.g. color, numeric, exact_match)')
     parser.add_argument('--test', action='store_true', default=False, help='Run with test config data')
-    parser.add_argument('--model', help='Model to use for evaluation (required for eval command)')
+    parser.add_argument('--model', help='Model(s) to use for evaluation, comma separated (required for eval command unless --models-file is given)')
+    parser.add_argument('--models-file', help='File with models to evaluate, one per line (# starts a comment)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of processes generating HTML in parallel (default: number of CPUs)')
+    parser.add_argument('--image-profile', choices=list(IMAGE_PROFILES), default=DEFAULT_IMAGE_PROFILE, help=f'How screenshots are encoded for eval prompts (default: {DEFAULT_IMAGE_PROFILE})')
+    parser.add_argument('--eval-concurrency', type=int, default=20, help='Number of evaluations running in parallel (default: 20)')
+    parser.add_argument('--rps', type=float, help='Max model requests per second, per model (default: unlimited)')
+    parser.add_argument('--tpm', type=int, help='Max estimated prompt tokens per minute, per model (default: unlimited)')
+    parser.add_argument('--pool-size', type=int, help='Number of browser pages rendering in parallel (default: 10)')
+    parser.add_argument('--no-artifacts', action='store_true', default=False, help="Don't write prompt.html and corrected page.html files during eval")
+    parser.add_argument('--force', action='store_true', default=False, help='Rebuild html/screenshot artifacts even if their inputs are unchanged')
+    parser.add_argument('--no-response-cache', action='store_true', default=False, help='Always call the model, even for prompts it already answered (replies are cached in .cache/responses)')
+    parser.add_argument('--base-url', help='OpenAI compatible API to evaluate with, e.g. a local mock_server.py (default: $OPENROUTER_BASE_URL or OpenRouter)')
+    parser.add_argument('--external-server', action='store_true', default=False, help='Load pages from a static server on localhost:8000 instead of serving data/ from disk')
 
     args = parser.parse_args()
 
-    if (args.command == "eval" and not args.model):
-        print("Error: 'model' argument is required for 'eval' command")
+    models = parse_models(args.model, args.models_file)
+
+    if (args.command in ["eval", "all"] and not models):
+        print(f"Error: 'model' argument is required for '{args.command}' command")
         sys.exit(1)
 
+    if args.no_response_cache:
+        response_cache.enabled = False
+
+    if args.base_url:
+        utils.OPENROUTER_BASE_URL = args.base_url
+
+    if args.pool_size:
+        browser_manager.set_pool_size(args.pool_size)
+
+    if args.external_server:
+        browser_manager.serve_assets = False
+
     def parse_testcase(testcase: str) -> list[tuple[str, str, str]]:
+        properties = args.property.split(',') if args.property else None
+        filtered = properties is not None or args.evaluator is not None
+
         result = []
         for tc in testcase.split(','):
             parts = tc.strip().split('.')
             project = parts[0]
-            
-            if len(parts) == 1:
-                pages_dir = os.path.join('data', project, 'pages')
-                pages = [d for d in os.listdir(pages_dir) if os.path.isdir(os.path.join(pages_dir, d))]
-            else:
-                pages = [parts[1]]
-                
-            for page in pages:
-                config_path = os.path.join('data', project, 'pages', page, 'config.json')
-                with open(config_path) as f:
-                    config_dict = json.load(f)
-                
-                variants = [parts[2]] if len(parts) == 3 else [v['id'] for v in config_dict.get('variants', [])]
+            page_id = parts[1] if len(parts) > 1 else None
+
+            # Named projects, pages and variants must exist, filters alone may select nothing
+            if project not in project_manifest.projects():
+                print(f"Error: project '{project}' not found in data/")
+                sys.exit(1)
+            if page_id is not None and (project, page_id) not in project_manifest.pages(project):
+                print(f"Error: page '{project}.{page_id}' not found (no config.json)")
+                sys.exit(1)
+            if len(parts) == 3 and parts[2] != "reference" and parts[2] not in [entry.variant_id for entry in project_manifest.variants(project, page_id)]:
+                print(f"Error: variant '{parts[2]}' not found in {project}.{page_id} config.json")
+                sys.exit(1)
+
+            for page in [page for p, page in project_manifest.pages(project) if page_id in (None, page)]:
+                if len(parts) == 3 and parts[2] == "reference":
+                    result.append((project, page, "reference"))
+                    continue
+
+                variants = project_manifest.select(project, page, parts[2] if len(parts) == 3 else None, properties, args.evaluator)
+                result.extend(entry.testcase for entry in variants)
                 
                 # Add reference variant if using wildcard in html/screenshot commands
-                if args.command in ["html", "screenshot"] and len(parts) < 3:
-                    variants.append("reference")
-                    
-                result.extend((project, page, variant) for variant in variants)
+                if args.command in ["html", "screenshot"] and len(parts) < 3 and (variants or not filtered):
+                    result.append((project, page, "reference"))
         return result
     
     testcases = parse_testcase(args.testcase)
     
-    if args.command in ["eval", "screenshot"]:
-        # Run all tasks in parallel
-        tasks = []
+    if args.command in ["html", "screenshot"]:
+        # Only rebuild artifacts whose inputs changed since they were last built
+        stale, fresh = plan_builds(testcases, args.command, force=args.force)
+        for project_id, page_id, variant_id in fresh:
+            print (f"[{args.command}] {project_id}.{page_id}.{variant_id} - up to date, skipping")
+        print (f"[{args.command}] {len(stale)} to build, {len(fresh)} up to date")
+
+    if args.command == "all":
+        await run_pipeline(testcases, models, args.test, save_artifacts=not args.no_artifacts, force=args.force, eval_concurrency=args.eval_concurrency, image_profile=args.image_profile, rps=args.rps, tpm=args.tpm)
+
+    elif args.command == "rescore":
+        # Models default to every model with stored responses
+        await run_rescore(testcases, models or None, concurrency=args.eval_concurrency)
+
+    elif args.command == "eval":
+        # Jobs only build their prompt once the scheduler gives them a slot. Every model has
+        # its own queue and rate limits, so a variant's evals may run far apart, and its
+        # prompt is held until all of them are done so it's only built once.
+        scheduler = EvalScheduler(concurrency=args.eval_concurrency, rps=args.rps, tpm=args.tpm)
         for project_id, page_id, variant_id in testcases:
+            release_prompt = hold_eval_prompt(project_id, page_id, variant_id, args.image_profile, len(models))
+            for model in models:
+                scheduler.submit(
+                    f"{project_id}.{page_id}.{variant_id}" + (f" ({model})" if len(models) > 1 else ""),
+                    model,
+                    lambda budget, project_id=project_id, page_id=page_id, variant_id=variant_id, model=model: run_eval(
+                        project_id, page_id, variant_id, model, args.test,
+                        save_artifacts=not args.no_artifacts, image_profile=args.image_profile, budget=budget,
+                    ),
+                    on_done=release_prompt,
+                )
+
+        scheduler.close()
+        await scheduler.run()
+
+    elif args.command == "screenshot":
+        async def screenshot_and_record(project_id, page_id, variant_id, input_hash):
             print (f"[{args.command}] {project_id}.{page_id}.{variant_id} - started")
-            if args.command == "eval":
-                tasks.append(run_eval(project_id, page_id, variant_id, args.model, args.test))
-            else:  # screenshot
-                tasks.append(run_screenshot(project_id, page_id, variant_id))
-        
-        # Wait for all tasks to complete
-        if tasks:
-            await asyncio.gather(*tasks)
+            # Pages that failed to load are left stale, so the next run shoots them again
+            if await run_screenshot(project_id, page_id, variant_id):
+                record_build(project_id, page_id, variant_id, "screenshot", input_hash)
+
+        # Run all tasks in parallel
+        await asyncio.gather(*[screenshot_and_record(*build) for build in stale])
             
     else:
-        # Run html tasks sequentially
-        for project_id, page_id, variant_id in testcases:
-            if args.command == "html":
-                print ("[html] " + project_id + "." + page_id + "." + variant_id)
-                run_html(project_id, page_id, variant_id)
+        # Run html tasks across a process pool, results come back in submission order
+        worker_times = defaultdict(list)
+        workers = max(1, args.workers)
+        chunksize = max(1, len(stale) // (workers * 4))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(run_html_timed, *zip(*[build[:3] for build in stale]), chunksize=chunksize) if stale else []
+
+            for (project_id, page_id, variant_id, input_hash), (pid, elapsed) in zip(stale, results):
+                print (f"[html] {project_id}.{page_id}.{variant_id} - {elapsed:.3f}s (worker {pid})")
+                record_build(project_id, page_id, variant_id, "html", input_hash)
+                worker_times[pid].append(elapsed)
+
+        for pid, times in sorted(worker_times.items()):
+            print (f"[html] worker {pid}: {len(times)} pages, total: {sum(times):.3f}s, avg: {sum(times) / len(times):.3f}s")
+
+    if args.command in ["eval", "screenshot", "all", "rescore"]:
+        browser_manager.print_stats()
+        asset_cache.print_stats()
+        data_url_cache.print_stats()
+        print_openrouter_stats()
+        if args.command in ["eval", "all"] and not args.test:
+            response_cache.print_stats()
+        print_timings()
+        await browser_manager.close()
+        await close_openrouter_clients()
 
 if __name__ == "__main__":
     asyncio.run(run())
\ No newline at end of file
@@ -6,11 +6,14 @@ load_dotenv()
 import os
 import sys
 import json
+import weakref
 from my_types import Config, StyleSheet
 from langfuse.openai import OpenAI
-from utils import apply_css_changes, generate_html, get_computed_css, load_config, read_and_encode_image, render_html, prompt_content_to_html, call_openrouter_with_retry
+from utils import apply_css_changes, generate_html, get_reference_computed_css, image_data_url, get_corrected_computed_css, load_config, write_prompt_html, call_openrouter_with_retry
 from css_properties import css_properties
 from eval_prompt import eval_prompt
+from run_html import build_html
+from image_profiles import DEFAULT_IMAGE_PROFILE, encode_image, get_image_profile
 
 RATE_LIMIT_DELAY = 10
 
@@ -18,55 +21,148 @@ class Response(BaseModel):
     reasoning: str
     css_changes: StyleSheet
 
-async def run_eval(project_id, page_id, variant_id, model, test=False):
-    page_dir = f"data/{project_id}/pages/{page_id}"
+def score_response(variant_css_changes: StyleSheet, response_css_changes: StyleSheet, reference_computed, corrected_computed, scores=None):
+    """
+    Score a model's CSS changes against the variant's, using computed styles of
+    the reference and corrected pages. Returns (error_code, error_details),
+    both None if the model fixed the page.
 
-    config = load_config(project_id, page_id)
+    `scores` are evaluator results by (selector, property) computed ahead, e.g.
+    by batch_scoring.score_batch for many responses at once. Properties missing
+    from it are evaluated here.
+    """
 
-    # Process model name for filename compatibility
-    # Replace slash characters with underscores to make it safe for filenames
-    model_id = model.replace("/", "_")
+    ### EVAL STEP 1. Check if model identified the correct CSS properties to fix
 
-    # Validate variant exists
-    variant = config.get_variant(variant_id)
+    # Check if model identified the correct CSS properties to fix
+    error_code = None
+    error_details = None
+    
+    # Convert variant changes to set of tuples for comparison
+    variant_changes_set = {
+        (selector, prop_name)
+        for selector, properties in variant_css_changes.items()
+        for prop_name in properties.keys()
+    }
 
-    if not variant:
-        print(f"Variant {variant_id} not found in config.json")
-        sys.exit(1)
+    # Convert response changes to set of tuples for comparison
+    response_changes_set = {
+        (selector, prop_name)
+        for selector, properties in response_css_changes.items() 
+        for prop_name in properties.keys()
+    }
 
-    # Load variant and reference files
-    variant_html_path = os.path.join(page_dir, "generated", variant.id, f"page.html")
-    variant_png_path = os.path.join(page_dir, "generated", variant.id, f"page.png") 
-    reference_png_path = os.path.join(page_dir, "generated", "reference.png")
-    eval_result_path = os.path.join(page_dir, "generated", variant.id, model_id, f"result.json")
+    # Check if sets match exactly
+    if variant_changes_set != response_changes_set:
+        missing = variant_changes_set - response_changes_set
+        extra = response_changes_set - variant_changes_set
+        
+        errors_arr = []
+        if missing:
+            missing_str = ", ".join([f"{s} -> {p}" for s,p in missing])
+            errors_arr.append(f"missing: {missing_str}")
+        if extra:
+            extra_str = ", ".join([f"{s} -> {p}" for s,p in extra])
+            errors_arr.append(f"unneccessary: {extra_str}")
+            
+        error_code = "wrong_css_properties"
+        error_details = ", ".join(errors_arr)
 
-    # Create directory for model results if it doesn't exist
-    model_result_dir = os.path.dirname(eval_result_path)
-    if not os.path.exists(model_result_dir):
-        os.makedirs(model_result_dir)
 
+    ### EVAL STEP 2. Check if model identified the correct CSS values to fix
 
-    if os.path.exists(eval_result_path) and not test:
-        try:
-            with open(eval_result_path, 'r') as f:
-                result_data = json.load(f)
+    if error_code is None:
+        
+        # For each CSS change in the response, validate using property-specific evaluator
+        for selector, properties in response_css_changes.items():
+            for prop_name, new_value in properties.items():
+                # Get evaluator function for this property
+                evaluator = css_properties[prop_name]
                 
-            # Only skip if there's no API error
-            if not (result_data.get("error_code") == "api_error"):
-                print(f"[eval] {project_id}.{page_id}.{variant.id} - Evaluation result already exists. Skipping...")
-                return
-            # If there was an API error, we'll continue with the evaluation
-        except json.JSONDecodeError:
-            # If the file exists but isn't valid JSON, continue with evaluation
-            pass
+                if evaluator is None:
+                    error_code = "css_property_without_evaluator"
+                    error_details = f"No evaluator defined for CSS property '{prop_name}'"
+                    break
+                
+                # Get reference and corrected values to compare
+                reference_value = reference_computed[selector][prop_name]
+                corrected_value = corrected_computed[selector][prop_name]
+                
+                # Run the evaluator, unless its result was computed in a batch
+                if scores is not None and (selector, prop_name) in scores:
+                    passed = scores[(selector, prop_name)]
+                else:
+                    passed = evaluator(reference_value, corrected_value)
+
+                if not passed:
+
+                    error_code = "wrong_css_value"
+                    error_details = f"Invalid value for {selector} -> {prop_name}:\n"
+                    error_details += f"Expected (reference): {reference_value}\n"
+                    error_details += f"Got (corrected): {corrected_value}"
+                    break
 
-    # Load HTML content
-    with open(variant_html_path, "r") as f:
-        variant_html = f.read()
+    return error_code, error_details
+
+class EvalPrompt:
+    """Prompt content of a variant, shared by the evals of all models running at the same time"""
+
+    def __init__(self, content):
+        self.content = content
+
+# Prompts in use by (project_id, page_id, variant_id, image profile). An entry
+# goes away with the last eval holding it, so prompts don't pile up in memory.
+_eval_prompts = weakref.WeakValueDictionary()
+
+# Prompts kept alive for evals that are scheduled but may not have started yet,
+# by the same key: {"prompt": EvalPrompt or None, "holds": count}
+_held_eval_prompts = {}
+
+def hold_eval_prompt(project_id, page_id, variant_id, image_profile, count):
+    """
+    Keep the variant's prompt, once built, until the returned release function
+    was called `count` times, e.g. once by each model's eval of the variant.
+    Without it, models that run apart (each has its own rate limits) would
+    build the prompt again after the earlier ones dropped it.
+    """
+    key = (project_id, page_id, variant_id, get_image_profile(image_profile).name)
+    hold = _held_eval_prompts.setdefault(key, {"prompt": None, "holds": 0})
+    hold["holds"] += count
+
+    def release():
+        hold["holds"] -= 1
+        if hold["holds"] <= 0:
+            hold["prompt"] = None
+            if _held_eval_prompts.get(key) is hold:
+                del _held_eval_prompts[key]
+
+    return release
+
+def get_eval_prompt(project_id, page_id, variant, config, profile, save_artifacts=True):
+    key = (project_id, page_id, variant.id, profile.name)
+    shared_prompt = _eval_prompts.get(key)
+    if shared_prompt is None:
+        shared_prompt = build_eval_prompt(project_id, page_id, variant, config, profile, save_artifacts)
+        _eval_prompts[key] = shared_prompt
+
+    hold = _held_eval_prompts.get(key)
+    if hold is not None:
+        hold["prompt"] = shared_prompt
+    return shared_prompt
+
+def build_eval_prompt(project_id, page_id, variant, config, profile, save_artifacts=True):
+    page_dir = f"data/{project_id}/pages/{page_id}"
+    variant_png_path = os.path.join(page_dir, "generated", variant.id, f"page.png") 
+    reference_png_path = os.path.join(page_dir, "generated", "reference.png")
 
-    # Encode images
-    variant_png_base64 = read_and_encode_image(variant_png_path)
-    reference_png_base64 = read_and_encode_image(reference_png_path)
+    # Generate HTML content in memory
+    variant_html = build_html(project_id, page_id, variant.id, config)
+
+    # Encode images with the image profile (encoded files are cached next to the screenshots)
+    variant_image_paths = encode_image(variant_png_path, profile)
+    reference_image_paths = encode_image(reference_png_path, profile)
+    variant_images = [image_data_url(path, profile.mime_type) for path in variant_image_paths]
+    reference_images = [image_data_url(path, profile.mime_type) for path in reference_image_paths]
 
 #     design_system_prompt = """
 # You must only use CSS values from predefined lists for each property type:
@@ -105,15 +201,68 @@ async def run_eval(project_id, page_id, variant_id, model, test=False):
     prompt = eval_prompt(
         errors_count=errors_count, 
         incorrect_html=variant_html, 
-        incorrect_image=f"data:image/png;base64,{variant_png_base64}",
-        correct_image=f"data:image/png;base64,{reference_png_base64}"
+        incorrect_image=variant_images,
+        correct_image=reference_images
     )
 
-    # Save prompt HTML
-    prompt_html = prompt_content_to_html(prompt)
-    prompt_output_path = os.path.join(page_dir, "generated", variant_id, f"prompt.html")
-    with open(prompt_output_path, "w") as f:
-        f.write(prompt_html)
+    # Save prompt HTML, linking the screenshots on disk. It's shared by all models
+    # and only rewritten when the prompt changes.
+    if save_artifacts:
+        prompt_output_path = os.path.join(page_dir, "generated", variant.id, f"prompt.html")
+        image_paths = dict(zip(variant_images + reference_images, variant_image_paths + reference_image_paths))
+        write_prompt_html(prompt_output_path, prompt, image_paths)
+
+    return EvalPrompt(prompt)
+
+async def run_eval(project_id, page_id, variant_id, model, test=False, save_artifacts=True, image_profile=DEFAULT_IMAGE_PROFILE, budget=None):
+    """
+    Evaluate `model` on a variant and save result.json. Returns the result.
+
+    `budget` (a scheduler.ModelBudget or BudgetLease) is spent on the model
+    call, waiting for its request and token limits. Replies served from the
+    response cache don't spend it.
+    """
+    page_dir = f"data/{project_id}/pages/{page_id}"
+
+    config = load_config(project_id, page_id)
+    profile = get_image_profile(image_profile)
+
+    # Process model name for filename compatibility
+    # Replace slash characters with underscores to make it safe for filenames
+    model_id = model.replace("/", "_")
+
+    # Validate variant exists
+    variant = config.get_variant(variant_id)
+
+    if not variant:
+        print(f"Variant {variant_id} not found in config.json")
+        sys.exit(1)
+
+    eval_result_path = os.path.join(page_dir, "generated", variant.id, model_id, f"result.json")
+
+    # Create directory for model results if it doesn't exist
+    model_result_dir = os.path.dirname(eval_result_path)
+    if not os.path.exists(model_result_dir):
+        os.makedirs(model_result_dir)
+
+
+    if os.path.exists(eval_result_path) and not test:
+        try:
+            with open(eval_result_path, 'r') as f:
+                result_data = json.load(f)
+                
+            # Only skip if there's no API error
+            if not (result_data.get("error_code") == "api_error"):
+                print(f"[eval] {project_id}.{page_id}.{variant.id} - Evaluation result already exists. Skipping...")
+                return result_data
+            # If there was an API error, we'll continue with the evaluation
+        except json.JSONDecodeError:
+            # If the file exists but isn't valid JSON, continue with evaluation
+            pass
+
+    # Built once per variant and shared with evals of other models running at the same time
+    shared_prompt = get_eval_prompt(project_id, page_id, variant, config, profile, save_artifacts)
+    prompt = shared_prompt.content
 
 
     def save_eval_result(error_code, error_details=None):
@@ -127,14 +276,22 @@ async def run_eval(project_id, page_id, variant_id, model, test=False):
         if error_details:
             eval_result["error_details"] = error_details
 
+        eval_result["image_profile"] = profile.to_dict()
+
+        if latency is not None:
+            eval_result["latency"] = latency
+
         # Save evaluation result
         with open(eval_result_path, "w", encoding='utf-8') as f:
             json.dump(eval_result, f, indent=2)
 
         print(f"[eval] {project_id}.{page_id}.{variant.id} - finished, correct: {error_code is None}, error: {error_code} ({error_details})")
 
+        return eval_result
+
     
     # Call OpenAI API
+    latency = None
     if not test:
         response_full = await call_openrouter_with_retry(
             messages=[
@@ -145,12 +302,14 @@ async def run_eval(project_id, page_id, variant_id, model, test=False):
             ],
             model=model, 
             response_format=Response,
-            name=f"{project_id}.{page_id}.{variant_id}.{model_id}"
+            name=f"{project_id}.{page_id}.{variant_id}.{model_id}",
+            budget=budget,
         )
 
+        latency = response_full["latency"]
+
         if "error" in response_full:
-            save_eval_result(response_full["error"], response_full["message"])
-            return
+            return save_eval_result(response_full["error"], response_full["message"])
 
         response = response_full["content"]
 
@@ -178,95 +337,27 @@ async def run_eval(project_id, page_id, variant_id, model, test=False):
     try:
         config.verify_css_changes(response.css_changes)
     except ValueError as e:
-        save_eval_result("invalid_css_changes", str(e))
-        return
+        return save_eval_result("invalid_css_changes", str(e))
 
     # Evaluate the response (result is 0-1 basically)
     corrected_page_css = apply_css_changes(config.correct_css, variant.css_changes, response.css_changes)
     corrected_page_html = generate_html(project_id, page_id, corrected_page_css)
 
     # Save LLM generated HTML
-    corrected_page_output_path = os.path.join(page_dir, "generated", variant_id, model_id, "page.html")
-    with open(corrected_page_output_path, "w", encoding='utf-8') as f:
-        f.write(corrected_page_html)
+    corrected_page_path = f"{project_id}/pages/{page_id}/generated/{variant_id}/{model_id}/page.html"
+    if save_artifacts:
+        with open(os.path.join("data", corrected_page_path), "w", encoding='utf-8') as f:
+            f.write(corrected_page_html)
 
     print(f"[eval] {project_id}.{page_id}.{variant_id} - Generating pages")
 
-    await render_html(f"{project_id}/pages/{page_id}/generated/{variant_id}/{model_id}/page.html")
-
-    # Get computed values for reference and corrected pages
-    reference_computed = await get_computed_css(f"{project_id}/pages/{page_id}/generated/reference.html")
-    corrected_computed = await get_computed_css(f"{project_id}/pages/{page_id}/generated/{variant_id}/{model_id}/page.html")
-
-    # # Save reference computed values
-    # reference_computed_path = os.path.join(page_dir, "generated", "reference.computed_values.json")
-    # with open(reference_computed_path, "w", encoding='utf-8') as f:
-    #     json.dump(reference_computed, f, indent=2)
-
-
-    ### EVAL STEP 1. Check if model identified the correct CSS properties to fix
-
-    # Check if model identified the correct CSS properties to fix
-    error_code = None
-    error_details = None
-    
-    # Convert variant changes to set of tuples for comparison
-    variant_changes_set = {
-        (selector, prop_name)
-        for selector, properties in variant.css_changes.items()
-        for prop_name in properties.keys()
-    }
-
-    # Convert response changes to set of tuples for comparison
-    response_changes_set = {
-        (selector, prop_name)
-        for selector, properties in response.css_changes.items() 
-        for prop_name in properties.keys()
-    }
-
-    # Check if sets match exactly
-    if variant_changes_set != response_changes_set:
-        missing = variant_changes_set - response_changes_set
-        extra = response_changes_set - variant_changes_set
-        
-        errors_arr = []
-        if missing:
-            missing_str = ", ".join([f"{s} -> {p}" for s,p in missing])
-            errors_arr.append(f"missing: {missing_str}")
-        if extra:
-            extra_str = ", ".join([f"{s} -> {p}" for s,p in extra])
-            errors_arr.append(f"unneccessary: {extra_str}")
-            
-        error_code = "wrong_css_properties"
-        error_details = ", ".join(errors_arr)
+    # Get computed values for reference (shared by all variants and models) and corrected
+    # pages (rendered once per distinct stylesheet, whichever models returned it, and
+    # stored for run_rescore)
+    corrected_computed = await get_corrected_computed_css(project_id, page_id, corrected_page_css, corrected_page_path, corrected_page_html)
+    reference_computed = await get_reference_computed_css(project_id, page_id, config)
 
 
-    ### EVAL STEP 2. Check if model identified the correct CSS values to fix
-
-    if error_code is None:
-        
-        # For each CSS change in the response, validate using property-specific evaluator
-        for selector, properties in response.css_changes.items():
-            for prop_name, new_value in properties.items():
-                # Get evaluator function for this property
-                evaluator = css_properties[prop_name]
-                
-                if evaluator is None:
-                    error_code = "css_property_without_evaluator"
-                    error_details = f"No evaluator defined for CSS property '{prop_name}'"
-                    break
-                
-                # Get reference and corrected values to compare
-                reference_value = reference_computed[selector][prop_name]
-                corrected_value = corrected_computed[selector][prop_name]
-                
-                # Run the evaluator
-                if not evaluator(reference_value, corrected_value):
-
-                    error_code = "wrong_css_value"
-                    error_details = f"Invalid value for {selector} -> {prop_name}:\n"
-                    error_details += f"Expected (reference): {reference_value}\n"
-                    error_details += f"Got (corrected): {corrected_value}"
-                    break
+    error_code, error_details = score_response(variant.css_changes, response.css_changes, reference_computed, corrected_computed)
 
-    save_eval_result(error_code, error_details)
+    return save_eval_result(error_code, error_details)
@@ -1,40 +1,43 @@
 import json
 import os
+import time
 from my_types import Config
 from utils import generate_html, apply_css_changes, read_page_styles, load_config
 
-def run_html(project_id, page_id, variant_id):
-    page_dir = f"data/{project_id}/pages/{page_id}"
+def html_path(project_id, page_id, variant_id):
+    """Path of the generated HTML relative to `data/`, also used as its URL path when rendering"""
+    if variant_id == "reference":
+        return f"{project_id}/pages/{page_id}/generated/reference.html"
+    return f"{project_id}/pages/{page_id}/generated/{variant_id}/page.html"
+
+def build_html(project_id, page_id, variant_id, config=None):
+    """Generate the HTML of a variant (or the reference page) in memory"""
+    if config is None:
+        config = load_config(project_id, page_id)
+
+    if variant_id == "reference":
+        return generate_html(project_id, page_id, config.correct_css)
+
+    variant = config.get_variant(variant_id)
+    variant_css = apply_css_changes(config.correct_css, variant.css_changes)
+    return generate_html(project_id, page_id, variant_css)
 
+def run_html(project_id, page_id, variant_id):
     # Read and parse styles.json into Config object
     config = load_config(project_id, page_id)
-        
-    # Create generated directory if it doesn't exist
-    generated_dir = os.path.join(page_dir, "generated")
-    os.makedirs(generated_dir, exist_ok=True)
 
-    if variant_id == "reference":
-        # Generate reference HTML
-        reference_html = generate_html(project_id, page_id, config.correct_css)
-        
-        # Save as reference.html
-        output_path = os.path.join(generated_dir, "reference.html") 
-        with open(output_path, "w", encoding='utf-8') as f:
-            f.write(reference_html)
-    else:
-        variant = config.get_variant(variant_id)
-        
-        # Generate variant HTML
-        variant_css = apply_css_changes(config.correct_css, variant.css_changes)
-        variant_html = generate_html(project_id, page_id, variant_css)
-
-        # Save variant file
-        
-        # Create variant directory if it doesn't exist
-        variant_dir = os.path.join(generated_dir, variant.id)
-        os.makedirs(variant_dir, exist_ok=True)
-        
-        # Save result in index.html in the variant directory
-        variant_path = os.path.join(variant_dir, "page.html")
-        with open(variant_path, "w", encoding='utf-8') as f:
-            f.write(variant_html)
+    html = build_html(project_id, page_id, variant_id, config)
+
+    # Save result, creating the variant directory if it doesn't exist
+    output_path = os.path.join("data", html_path(project_id, page_id, variant_id))
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w", encoding='utf-8') as f:
+        f.write(html)
+
+    return html
+
+def run_html_timed(project_id, page_id, variant_id):
+    """run_html for process pool workers, returns the worker's pid and the time it took"""
+    start = time.perf_counter()
+    run_html(project_id, page_id, variant_id)
+    return os.getpid(), time.perf_counter() - start
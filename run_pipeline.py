@@ -0,0 +1,124 @@
+import asyncio
+import os
+from build_manifest import plan_builds, record_build
+from image_profiles import DEFAULT_IMAGE_PROFILE
+from run_html import build_html, html_path
+from run_eval import hold_eval_prompt, run_eval
+from scheduler import EvalScheduler
+from utils import browser_manager, render_html
+
+async def run_pipeline(testcases, models, test=False, save_artifacts=True, force=False, eval_concurrency=20, queue_size=20, image_profile=DEFAULT_IMAGE_PROFILE, rps=None, tpm=None):
+    """
+    Push every (project_id, page_id, variant_id) through html, screenshot and
+    eval as soon as its inputs are ready, instead of running one stage at a time.
+
+    Stages are connected with bounded queues, so HTML generation runs ahead of
+    rendering by at most `queue_size` pages. A variant is submitted to an
+    EvalScheduler once its own screenshot and its page's reference screenshot
+    exist, one job per model. The variant's prompt is held until all of them are
+    done, so it's built once however far apart the models run. The scheduler
+    keeps at most `eval_concurrency` calls in flight across all models and each
+    model within its `rps`/`tpm` budget.
+    """
+    # Start the browser while the first pages are being generated
+    warmup = asyncio.create_task(browser_manager.initialize())
+
+    # Every page needs its reference rendered before its variants can be evaluated
+    pages = list(dict.fromkeys((project_id, page_id) for project_id, page_id, _ in testcases))
+    references = [(project_id, page_id, "reference") for project_id, page_id in pages]
+    variants = [testcase for testcase in testcases if testcase[2] != "reference"]
+
+    html_builds, _ = plan_builds(references + variants, "html", force=force)
+    html_hashes = {build[:3]: build[3] for build in html_builds}
+    screenshot_builds, _ = plan_builds(references + variants, "screenshot", force=force)
+    screenshot_hashes = {build[:3]: build[3] for build in screenshot_builds}
+
+    reference_ready = {page: asyncio.Event() for page in pages}
+    scheduler = EvalScheduler(concurrency=eval_concurrency, rps=rps, tpm=tpm)
+    # Variants rendered before their page's reference, waiting to be submitted
+    pending_evals = []
+
+    render_workers = browser_manager.max_concurrent_pages
+    render_queue = asyncio.Queue(maxsize=queue_size)
+
+    loop = asyncio.get_running_loop()
+
+    def generate(project_id, page_id, variant_id):
+        html = build_html(project_id, page_id, variant_id)
+
+        if (project_id, page_id, variant_id) in html_hashes:
+            output_path = os.path.join("data", html_path(project_id, page_id, variant_id))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, "w", encoding='utf-8') as f:
+                f.write(html)
+
+        return html
+
+    async def generate_stage():
+        # References first, so evaluation of each page can start as early as possible
+        for testcase in references + variants:
+            project_id, page_id, variant_id = testcase
+            try:
+                html = await loop.run_in_executor(None, generate, *testcase)
+                if testcase in html_hashes:
+                    record_build(*testcase, "html", html_hashes[testcase])
+                print(f"[html] {project_id}.{page_id}.{variant_id}")
+            except Exception as e:
+                print(f"[html] {project_id}.{page_id}.{variant_id} - failed: {e}")
+                html = None
+
+            await render_queue.put((testcase, html))
+
+        for _ in range(render_workers):
+            await render_queue.put(None)
+
+    async def render_stage():
+        await warmup
+
+        while (item := await render_queue.get()) is not None:
+            testcase, html = item
+            project_id, page_id, variant_id = testcase
+
+            if html is not None and testcase in screenshot_hashes:
+                try:
+                    # Pages that failed to load are left stale, so the next run shoots them again
+                    if await render_html(html_path(*testcase), html=html):
+                        record_build(*testcase, "screenshot", screenshot_hashes[testcase])
+                        print(f"[screenshot] {project_id}.{page_id}.{variant_id} - finished")
+                    else:
+                        print(f"[screenshot] {project_id}.{page_id}.{variant_id} - page failed to load, not recorded as up to date")
+                except Exception as e:
+                    print(f"[screenshot] {project_id}.{page_id}.{variant_id} - failed: {e}")
+
+            if variant_id == "reference":
+                reference_ready[(project_id, page_id)].set()
+            else:
+                pending_evals.append(asyncio.create_task(submit_eval(testcase)))
+
+    async def submit_eval(testcase):
+        project_id, page_id, variant_id = testcase
+        await reference_ready[(project_id, page_id)].wait()
+
+        print(f"[eval] {project_id}.{page_id}.{variant_id} - queued")
+        release_prompt = hold_eval_prompt(project_id, page_id, variant_id, image_profile, len(models))
+        for model in models:
+            scheduler.submit(
+                f"{project_id}.{page_id}.{variant_id}" + (f" ({model})" if len(models) > 1 else ""),
+                model,
+                lambda budget, model=model: run_eval(
+                    project_id, page_id, variant_id, model, test,
+                    save_artifacts=save_artifacts, image_profile=image_profile, budget=budget,
+                ),
+                on_done=release_prompt,
+            )
+
+    async def render_then_close_scheduler():
+        await asyncio.gather(*[render_stage() for _ in range(render_workers)])
+        await asyncio.gather(*pending_evals)
+        scheduler.close()
+
+    await asyncio.gather(
+        generate_stage(),
+        render_then_close_scheduler(),
+        scheduler.run(),
+    )
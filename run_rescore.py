@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+from pydantic import ValidationError
+from batch_scoring import score_responses
+from run_eval import Response, score_response
+from utils import apply_css_changes, generate_html, get_corrected_computed_css, get_reference_computed_css, load_config
+
+# Errors of evals that never got a usable response, there's nothing to rescore
+UNSCORED_ERRORS = ("api_error", "json_format_error")
+
+
+def find_responses(testcases, models=None):
+    """(project_id, page_id, variant_id, model_id) of every stored response of the given test cases"""
+    model_ids = [model.replace("/", "_") for model in models] if models else None
+
+    found = []
+    for project_id, page_id, variant_id in testcases:
+        variant_dir = os.path.join("data", project_id, "pages", page_id, "generated", variant_id)
+        if not os.path.isdir(variant_dir):
+            continue
+
+        for model_id in sorted(os.listdir(variant_dir)):
+            if model_ids is not None and model_id not in model_ids:
+                continue
+            if os.path.exists(os.path.join(variant_dir, model_id, "response.json")):
+                found.append((project_id, page_id, variant_id, model_id))
+
+    return found
+
+
+async def load_response(project_id, page_id, variant_id, model_id):
+    """
+    Everything needed to score a stored response again, or None if the eval
+    has nothing to rescore.
+
+    The corrected page is rebuilt from the page template, and computed styles
+    come from the stored computed_values.json while it's up to date, so the
+    browser is only needed for pages whose inputs changed.
+    """
+    name = f"{project_id}.{page_id}.{variant_id}.{model_id}"
+    model_dir = os.path.join("data", project_id, "pages", page_id, "generated", variant_id, model_id)
+    eval_result_path = os.path.join(model_dir, "result.json")
+
+    previous = {}
+    if os.path.exists(eval_result_path):
+        with open(eval_result_path, "r") as f:
+            previous = json.load(f)
+        if previous.get("error_code") in UNSCORED_ERRORS:
+            return None
+
+    config = load_config(project_id, page_id)
+    variant = config.get_variant(variant_id)
+    if not variant:
+        print(f"[rescore] {project_id}.{page_id}.{variant_id} - variant not found in config.json, skipping")
+        return None
+
+    with open(os.path.join(model_dir, "response.json"), "r") as f:
+        try:
+            response = Response.model_validate(json.load(f))
+        except (json.JSONDecodeError, ValidationError) as e:
+            print(f"[rescore] {name} - invalid response.json, skipping: {e}")
+            return None
+
+    loaded = {
+        "name": name,
+        "result_path": eval_result_path,
+        "previous": previous,
+        "variant_css_changes": variant.css_changes,
+        "response_css_changes": response.css_changes,
+        "error": None,
+    }
+
+    try:
+        config.verify_css_changes(response.css_changes)
+    except ValueError as e:
+        loaded["error"] = ("invalid_css_changes", str(e))
+        return loaded
+
+    corrected_page_css = apply_css_changes(config.correct_css, variant.css_changes, response.css_changes)
+    corrected_page_path = f"{project_id}/pages/{page_id}/generated/{variant_id}/{model_id}/page.html"
+    corrected_page_html = generate_html(project_id, page_id, corrected_page_css)
+
+    loaded["reference_computed"] = await get_reference_computed_css(project_id, page_id, config)
+    loaded["corrected_computed"] = await get_corrected_computed_css(project_id, page_id, corrected_page_css, corrected_page_path, corrected_page_html, render=False)
+    return loaded
+
+
+def save_rescore(loaded, error_code, error_details):
+    """Rewrite result.json of a rescored response, keeping the fields that came from the model call (image profile, latency)"""
+    previous = loaded["previous"]
+
+    eval_result = {"passed": error_code is None}
+    if error_code:
+        eval_result["error_code"] = error_code
+    if error_details:
+        eval_result["error_details"] = error_details
+    for key, value in previous.items():
+        if key not in ("passed", "error_code", "error_details"):
+            eval_result[key] = value
+
+    with open(loaded["result_path"], "w", encoding='utf-8') as f:
+        json.dump(eval_result, f, indent=2)
+
+    changed = previous.get("passed") != eval_result["passed"] or previous.get("error_code") != eval_result.get("error_code")
+    if changed:
+        print(f"[rescore] {loaded['name']} - correct: {previous.get('passed')} -> {eval_result['passed']}, error: {error_code} ({error_details})")
+
+    return eval_result
+
+
+def batch_scores(scorable):
+    """Evaluator results of all responses in one batch, or None per response if a value can't be parsed"""
+    try:
+        return score_responses([
+            (loaded["response_css_changes"], loaded["reference_computed"], loaded["corrected_computed"])
+            for loaded in scorable
+        ])
+    except Exception as e:
+        # Score one by one instead, so only the responses with broken values fail
+        print(f"[rescore] batch scoring failed, scoring responses one by one: {e}")
+        return [None] * len(scorable)
+
+
+async def run_rescore(testcases, models=None, concurrency=50):
+    """
+    Rescore every stored response of the test cases (optionally only of `models`).
+
+    Responses are loaded at most `concurrency` at a time, then the values of
+    all of them are scored with a single batch_scoring call.
+    """
+    responses = find_responses(testcases, models)
+    print(f"[rescore] {len(responses)} stored responses")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load_bounded(response):
+        async with semaphore:
+            try:
+                return await load_response(*response)
+            except Exception as e:
+                print(f"[rescore] {'.'.join(response)} - failed: {e}")
+                return None
+
+    loaded_responses = [loaded for loaded in await asyncio.gather(*[load_bounded(response) for response in responses]) if loaded is not None]
+
+    scorable = [loaded for loaded in loaded_responses if loaded["error"] is None]
+    for loaded, scores in zip(scorable, batch_scores(scorable)):
+        loaded["scores"] = scores
+
+    results = []
+    for loaded in loaded_responses:
+        try:
+            if loaded["error"] is not None:
+                error_code, error_details = loaded["error"]
+            else:
+                error_code, error_details = score_response(
+                    loaded["variant_css_changes"], loaded["response_css_changes"],
+                    loaded["reference_computed"], loaded["corrected_computed"],
+                    scores=loaded["scores"],
+                )
+            results.append(save_rescore(loaded, error_code, error_details))
+        except Exception as e:
+            print(f"[rescore] {loaded['name']} - failed: {e}")
+
+    passed = sum(1 for result in results if result["passed"])
+    print(f"[rescore] {len(results)} rescored, {len(responses) - len(results)} skipped, passed: {passed}")
+
+    return results
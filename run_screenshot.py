@@ -1,9 +1,14 @@
 from utils import render_html
+from run_html import build_html, html_path
 
 async def run_screenshot(project_id, page_id, variant_id):
-    if (variant_id == "reference"):
-        await render_html(f"{project_id}/pages/{page_id}/generated/reference.html")
+    """Render the page and save its screenshot. Returns False if the page failed to load."""
+    # Render straight from memory, generated HTML files are not needed on disk
+    html = build_html(project_id, page_id, variant_id)
+    loaded = await render_html(html_path(project_id, page_id, variant_id), html=html)
+
+    if loaded:
+        print(f"[screenshot] {project_id}.{page_id}.{variant_id} - finished")
     else:
-        await render_html(f"{project_id}/pages/{page_id}/generated/{variant_id}/page.html")
-        
-    print(f"[screenshot] {project_id}.{page_id}.{variant_id} - finished")
+        print(f"[screenshot] {project_id}.{page_id}.{variant_id} - page failed to load, screenshot not recorded as up to date")
+    return loaded
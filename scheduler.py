@@ -0,0 +1,283 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+# Rough token cost of one image in a prompt, used to spend the tokens-per-minute
+# budget before the call (providers only report usage after it)
+IMAGE_TOKENS = 1000
+CHARS_PER_TOKEN = 4
+
+
+def estimate_prompt_tokens(content) -> int:
+    """Rough token count of a prompt's content (a string or a list of text/image parts)"""
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + 1
+
+    tokens = 0
+    for item in content:
+        if item["type"] == "text":
+            tokens += len(item["text"]) // CHARS_PER_TOKEN + 1
+        elif item["type"] == "image_url":
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+class TokenBucket:
+    """Refills `rate` units per second up to `capacity`. `acquire` waits until enough units are available."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def wait_for(self, amount: float) -> float:
+        """Wait until `amount` units are available without taking them, returns the time waited"""
+        # A request bigger than the bucket would wait forever, let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        waited = 0.0
+
+        # Callers are served in order, so big requests aren't starved by small ones
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+
+        return waited
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Take `amount` units, returns the time waited for them"""
+        waited = await self.wait_for(amount)
+        self.take(min(amount, self.capacity))
+        return waited
+
+    def take(self, amount: float):
+        """Take `amount` units right away. The bucket may go below zero, which delays later callers."""
+        self._refill()
+        self.tokens -= amount
+
+    def put_back(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ModelBudget:
+    """
+    Requests per second and tokens per minute allowed for one model, None means unlimited.
+
+    The scheduler `reserve`s a request before a job takes a concurrency slot,
+    so jobs never wait for the budget while holding one. Callers without a
+    reservation use `spend` directly.
+    """
+
+    def __init__(self, rps: Optional[float] = None, tpm: Optional[int] = None):
+        self.requests = TokenBucket(rps, max(1.0, rps)) if rps else None
+        self.tokens = TokenBucket(tpm / 60, tpm) if tpm else None
+        self.waited = 0.0
+        # Running estimate of a prompt's tokens, what a reservation waits for before the prompt exists
+        self.expected_tokens = 0.0
+
+    async def reserve(self) -> "BudgetLease":
+        """Wait until the model may take another request and reserve it"""
+        # Waits are awaited before they're added, other callers update `waited` meanwhile
+        if self.requests:
+            waited = await self.requests.acquire(1)
+            self.waited += waited
+        if self.tokens and self.expected_tokens:
+            waited = await self.tokens.wait_for(self.expected_tokens)
+            self.waited += waited
+        return BudgetLease(self)
+
+    def _spend_tokens(self, tokens: int):
+        self.expected_tokens = tokens if not self.expected_tokens else 0.8 * self.expected_tokens + 0.2 * tokens
+        if self.tokens and tokens:
+            self.tokens.take(min(tokens, self.tokens.capacity))
+
+    async def spend(self, tokens: int = 0):
+        """Wait for the budget of a request with `tokens` prompt tokens and take it"""
+        if self.requests:
+            waited = await self.requests.acquire(1)
+            self.waited += waited
+        if self.tokens and tokens:
+            waited = await self.tokens.wait_for(tokens)
+            self.waited += waited
+        self._spend_tokens(tokens)
+
+    def cancel(self):
+        """Nothing is reserved up front when the budget is used directly"""
+
+
+class BudgetLease:
+    """A request reserved from a ModelBudget, spent once the prompt is known or given back unused"""
+
+    def __init__(self, budget: ModelBudget):
+        self.budget = budget
+        self.open = True
+
+    async def spend(self, tokens: int = 0):
+        # The request and the wait for tokens were already taken care of by the reservation
+        if self.open:
+            self.open = False
+            self.budget._spend_tokens(tokens)
+
+    def cancel(self):
+        """Give back the reserved request, e.g. when the job didn't call the model"""
+        if self.open:
+            self.open = False
+            if self.budget.requests:
+                self.budget.requests.put_back(1)
+
+
+@dataclass
+class Job:
+    name: str
+    model: str
+    # Creates the job's coroutine. Called only once a slot is free, so prompts and
+    # images of queued jobs aren't built ahead of time
+    factory: Callable[["BudgetLease"], Awaitable[Optional[dict]]]
+    # Called once the job is done for good, after its last retry
+    on_done: Optional[Callable[[], None]] = None
+    attempt: int = 0
+
+
+class EvalScheduler:
+    """
+    Runs eval jobs with at most `concurrency` in flight, each model limited to
+    its `rps`/`tpm` budget.
+
+    Every model has its own queue, and a job first reserves its model's
+    budget and only then takes one of the shared slots, so a rate-limited
+    model can't fill the slots with waiting jobs and starve the others.
+
+    A job whose result has error_code "api_error" is queued again with
+    exponential backoff, up to `max_retries` times. Counters of queued,
+    in-flight, done, retried and failed jobs are printed every
+    `report_interval` seconds while running.
+
+    Jobs can be submitted while the scheduler runs, `run` returns once
+    `close` was called and every job is done.
+    """
+
+    def __init__(self, concurrency=20, rps=None, tpm=None, max_retries=3, retry_delay=5.0, report_interval=10.0):
+        self.concurrency = max(1, concurrency)
+        self.rps = rps
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.report_interval = report_interval
+
+        self._budgets = {}
+        self._queues = {}
+        self._dispatchers = []
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._unfinished = 0
+        self._closed = False
+        self._finished = asyncio.Event()
+        self.results = {}
+        self.counters = {"queued": 0, "in_flight": 0, "done": 0, "retried": 0, "failed": 0}
+
+    def budget(self, model: str) -> ModelBudget:
+        if model not in self._budgets:
+            self._budgets[model] = ModelBudget(self.rps, self.tpm)
+        return self._budgets[model]
+
+    def submit(self, name: str, model: str, factory, on_done=None):
+        if model not in self._queues:
+            self._queues[model] = asyncio.Queue()
+            self._dispatchers.append(asyncio.ensure_future(self._dispatch(model)))
+
+        self._queues[model].put_nowait(Job(name, model, factory, on_done))
+        self._unfinished += 1
+        self.counters["queued"] += 1
+
+    def close(self):
+        """No more jobs will be submitted"""
+        self._closed = True
+        self._check_finished()
+
+    def _check_finished(self):
+        if self._closed and self._unfinished == 0:
+            self._finished.set()
+
+    async def _requeue(self, job: Job, delay: float):
+        await asyncio.sleep(delay)
+        self._queues[job.model].put_nowait(job)
+
+    async def _dispatch(self, model: str):
+        queue = self._queues[model]
+        budget = self.budget(model)
+        while True:
+            job = await queue.get()
+            lease = await budget.reserve()
+            await self._slots.acquire()
+            asyncio.ensure_future(self._run_job(job, lease))
+
+    async def _run_job(self, job: Job, lease: BudgetLease):
+        self.counters["queued"] -= 1
+        self.counters["in_flight"] += 1
+
+        try:
+            result = await job.factory(lease)
+        except Exception as e:
+            print(f"[eval] {job.name} - failed: {e}")
+            result = {"passed": False, "error_code": "exception", "error_details": str(e)}
+        finally:
+            # A job that didn't call the model (skipped, cached, failed early) gives its request back
+            lease.cancel()
+            self.counters["in_flight"] -= 1
+            self._slots.release()
+
+        if result and result.get("error_code") == "api_error" and job.attempt < self.max_retries:
+            delay = self.retry_delay * 2 ** job.attempt
+            print(f"[eval] {job.name} - api error, retrying in {delay:.1f}s (attempt {job.attempt + 2}/{self.max_retries + 1})")
+            job.attempt += 1
+            self.counters["retried"] += 1
+            self.counters["queued"] += 1
+            asyncio.ensure_future(self._requeue(job, delay))
+            return
+
+        self.results[job.name] = result
+        self.counters["done"] += 1
+        if job.on_done:
+            job.on_done()
+        if result and result.get("error_code") in ("api_error", "exception"):
+            self.counters["failed"] += 1
+
+        self._unfinished -= 1
+        self._check_finished()
+
+    def print_counters(self):
+        counters = ", ".join(f"{key.replace('_', ' ')}: {value}" for key, value in self.counters.items())
+        print(f"[scheduler] {counters}")
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.print_counters()
+
+    async def run(self) -> dict:
+        """Run until `close` was called and every submitted job is done, returns results by job name"""
+        reporter = asyncio.create_task(self._report())
+
+        await self._finished.wait()
+
+        for task in self._dispatchers + [reporter]:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, reporter, return_exceptions=True)
+
+        self.print_counters()
+        for model, budget in self._budgets.items():
+            if budget.waited:
+                print(f"[scheduler] {model}: waited {budget.waited:.1f}s for rate limits")
+
+        return self.results
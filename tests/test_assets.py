@@ -0,0 +1,42 @@
+import os
+from assets import AssetCache, DataUrlCache
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_asset_cache_evicts_least_recently_used(tmp_path):
+    paths = [write(tmp_path / f"{i}.png", bytes([i]) * 100) for i in range(3)]
+    cache = AssetCache(max_bytes=250)
+
+    for path in paths[:2] + paths[:1] + paths[2:]:
+        cache.read(path)
+
+    assert list(cache._entries) == [paths[0], paths[2]]
+    assert cache.size == 200
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_asset_cache_rereads_changed_files(tmp_path):
+    path = write(tmp_path / "font.woff2", b"a" * 100)
+    cache = AssetCache()
+    cache.read(path)
+
+    write(path, b"b" * 50)
+    os.utime(path, ns=(1, 1))
+
+    assert cache.read(path) == b"b" * 50
+    assert cache.size == 50
+
+
+def test_data_url_cache_encodes_each_image_once(tmp_path):
+    path = write(tmp_path / "page.png", b"\x89PNG")
+    cache = DataUrlCache()
+
+    url = cache.data_url(path)
+    assert url == "data:image/png;base64,iVBORw=="
+    assert cache.data_url(path) is url
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,77 @@
+import random
+import pytest
+from batch_scoring import score_batch, score_responses
+from css_properties import css_properties
+from run_eval import score_response
+
+# Computed values each evaluator is scored on, close and far apart
+VALUES = {
+    "margin-top": ["0px", "16px", "18px", "24px", "40px"],
+    "display": ["flex", "block", "grid"],
+    "grid-template-columns": ["100px 200px", "110px 210px", "100px", "100px 400px", ""],
+    "color": ["rgb(0, 0, 0)", "rgb(20, 20, 20)", "rgb(255, 0, 0)", "rgb(250, 10, 10)", "rgb(0, 0, 255)"],
+    "aspect-ratio": ["16/9", "4/3", "1.7", "1"],
+    "filter": ["none", "blur(2px)"],
+}
+SELECTORS = [".header", ".title", ".card", ".footer"]
+
+
+def random_case(rng):
+    """A variant, a response fixing the same properties and computed styles of both pages"""
+    changes = {}
+    for selector in rng.sample(SELECTORS, rng.randint(1, 3)):
+        changes[selector] = {prop: "changed" for prop in rng.sample(list(VALUES), rng.randint(1, 3))}
+
+    reference_computed = {}
+    corrected_computed = {}
+    for selector, properties in changes.items():
+        reference_computed[selector] = {prop: rng.choice(VALUES[prop]) for prop in properties}
+        corrected_computed[selector] = {prop: rng.choice(VALUES[prop]) for prop in properties}
+    return changes, changes, reference_computed, corrected_computed
+
+
+def test_score_batch_matches_scalar_evaluators():
+    rng = random.Random(0)
+    rows = [(prop, rng.choice(values), rng.choice(values)) for _ in range(200) for prop, values in VALUES.items() if prop != "filter"]
+    properties, references, news = zip(*rows)
+    numeric_tolerances = [0.0, 0.1, 0.25, 1.0]
+    color_tolerances = [0.0, 0.05, 0.25]
+
+    scores = score_batch(properties, references, news, numeric_tolerances, color_tolerances)
+
+    for k, (prop, reference, new) in enumerate(rows):
+        evaluator = css_properties[prop]
+        for i, numeric_tolerance in enumerate(numeric_tolerances):
+            for j, color_tolerance in enumerate(color_tolerances):
+                if prop == "display":
+                    expected = evaluator(reference, new)
+                elif prop == "color":
+                    expected = evaluator(reference, new, color_tolerance)
+                else:
+                    expected = evaluator(reference, new, numeric_tolerance)
+                assert scores[i, j, k] == expected, (prop, reference, new, numeric_tolerance, color_tolerance)
+
+
+def test_score_responses_gives_score_response_results():
+    rng = random.Random(1)
+    cases = [random_case(rng) for _ in range(300)]
+
+    batch = score_responses([(response, reference, corrected) for _, response, reference, corrected in cases])
+
+    for (variant, response, reference, corrected), scores in zip(cases, batch):
+        assert score_response(variant, response, reference, corrected, scores=scores) == score_response(variant, response, reference, corrected)
+
+    # Both passing and failing responses were compared
+    results = [score_response(*case)[0] for case in cases]
+    assert {None, "wrong_css_value", "css_property_without_evaluator"} <= set(results)
+
+
+def test_score_responses_leaves_out_properties_without_values():
+    scores = score_responses([({".a": {"margin-top": "x", "filter": "x"}}, {".a": {"margin-top": "16px"}}, {})])
+    assert scores == [{}]
+
+
+def test_score_batch_rejects_properties_without_evaluator():
+    with pytest.raises(ValueError):
+        score_batch(["filter"], ["none"], ["none"])
+    assert score_batch([], [], []).shape == (1, 1, 0)
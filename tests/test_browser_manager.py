@@ -0,0 +1,86 @@
+import asyncio
+import posixpath
+from urllib.parse import urlsplit
+import pytest
+from utils import ASSET_BASE_URL, BrowserManager
+
+
+class FakeRoute:
+    def __init__(self, url):
+        self.request = type("Request", (), {"url": url})()
+        self.outcome = None
+
+    async def fulfill(self, status, body, content_type=None):
+        self.outcome = ("fulfilled", status, body)
+
+    async def abort(self):
+        self.outcome = ("aborted",)
+
+    async def continue_(self):
+        self.outcome = ("network",)
+
+
+class FakePage:
+    """Navigates by asking the manager's route handler, optionally rewriting the URL like a browser might"""
+
+    def __init__(self, manager, rewrite=lambda url: url):
+        self.manager = manager
+        self.rewrite = rewrite
+        self.routes = []
+
+    async def goto(self, url, wait_until=None):
+        route = FakeRoute(self.rewrite(url))
+        self.routes.append(route)
+        await self.manager._route(route)
+        if route.outcome[0] == "aborted":
+            raise RuntimeError("net::ERR_FAILED")
+
+
+def browser_manager(rewrite=lambda url: url):
+    manager = BrowserManager(max_concurrent_pages=1, serve_assets=False)
+    page = FakePage(manager, rewrite)
+    manager._initialized = True
+    manager._idle_slots = asyncio.Queue()
+    manager._idle_slots.put_nowait((None, page))
+    return manager, page
+
+
+@pytest.mark.parametrize("rewrite", [
+    lambda url: url,
+    lambda url: url + "?utm=1&render=2",
+    lambda url: url + "#top",
+    lambda url: url.replace("http://localhost:8000", "http://localhost:8000/."),
+])
+def test_in_memory_document_is_served_for_its_render(rewrite):
+    async def main():
+        manager, page = browser_manager(rewrite)
+        _, _, error = await manager.get_page("glossier/pages/home/generated/v1/page.html", html="<p>v1</p>")
+        return error, page.routes[0], manager._documents
+
+    error, route, documents = asyncio.run(main())
+    assert error is None
+    assert route.outcome == ("fulfilled", 200, "<p>v1</p>")
+    # Relative asset URLs resolve from the same directory as the file on disk
+    assert posixpath.dirname(posixpath.normpath(urlsplit(route.request.url).path)) == "/glossier/pages/home/generated/v1"
+    assert documents == {}
+
+
+def test_render_without_document_fails_navigation():
+    async def main():
+        manager, page = browser_manager()
+        # Navigating to a render whose document is gone
+        route = FakeRoute(f"{ASSET_BASE_URL}/glossier/pages/home/generated/v1/__render_99__page.html")
+        await manager._route(route)
+        return route
+
+    assert asyncio.run(main()).outcome == ("aborted",)
+
+
+def test_other_requests_go_to_the_network():
+    async def main():
+        manager, _ = browser_manager()
+        route = FakeRoute(f"{ASSET_BASE_URL}/glossier/fonts/font.woff2?render=1")
+        await manager._route(route)
+        return route
+
+    assert asyncio.run(main()).outcome == ("network",)
@@ -0,0 +1,43 @@
+import os
+import pytest
+from build_manifest import _asset_hashes, artifact_input_hash
+
+
+@pytest.fixture
+def page(tmp_path, monkeypatch):
+    page_dir = tmp_path / "data" / "project" / "pages" / "page"
+    page_dir.mkdir(parents=True)
+    (page_dir / "page.html").write_text("<div class='a'></div>")
+    (page_dir / "config.json").write_text("{}")
+    (tmp_path / "data" / "project" / "global.css").write_text("body {}")
+    monkeypatch.chdir(tmp_path)
+    return page_dir
+
+
+@pytest.mark.parametrize("path", ["data/project/pages/page/page.html", "data/project/pages/page/config.json", "data/project/global.css"])
+def test_page_inputs_change_the_hash(page, path):
+    before = artifact_input_hash("project", "page", "v1", "html", {".a": {"color": "red"}})
+    with open(path, "a") as f:
+        f.write(" ")
+    assert artifact_input_hash("project", "page", "v1", "html", {".a": {"color": "red"}}) != before
+
+
+def test_css_changes_change_the_hash(page):
+    red = artifact_input_hash("project", "page", "v1", "html", {".a": {"color": "red"}})
+    blue = artifact_input_hash("project", "page", "v1", "html", {".a": {"color": "blue"}})
+    assert red != blue
+    assert artifact_input_hash("project", "page", "v1", "html", {".a": {"color": "red"}}) == red
+
+
+def test_assets_only_change_screenshots(page):
+    html = artifact_input_hash("project", "page", "reference", "html")
+    screenshot = artifact_input_hash("project", "page", "reference", "screenshot")
+
+    os.makedirs("data/project/fonts")
+    with open("data/project/fonts/font.woff2", "wb") as f:
+        f.write(b"font")
+    # Asset hashes are computed once per run
+    _asset_hashes.clear()
+
+    assert artifact_input_hash("project", "page", "reference", "html") == html
+    assert artifact_input_hash("project", "page", "reference", "screenshot") != screenshot
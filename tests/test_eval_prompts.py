@@ -0,0 +1,82 @@
+import asyncio
+import gc
+from types import SimpleNamespace
+import pytest
+import run_eval
+from image_profiles import DEFAULT_IMAGE_PROFILE, get_image_profile
+from scheduler import EvalScheduler
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    built = []
+
+    def build_eval_prompt(project_id, page_id, variant, config, profile, save_artifacts=True):
+        built.append(variant.id)
+        return run_eval.EvalPrompt(f"prompt of {variant.id}")
+
+    monkeypatch.setattr(run_eval, "build_eval_prompt", build_eval_prompt)
+    return built
+
+
+def get_prompt(variant_id):
+    variant = SimpleNamespace(id=variant_id)
+    return run_eval.get_eval_prompt("project", "page", variant, None, get_image_profile(DEFAULT_IMAGE_PROFILE))
+
+
+def test_held_prompt_outlives_its_evals(builds):
+    release = run_eval.hold_eval_prompt("project", "page", "v1", DEFAULT_IMAGE_PROFILE, 2)
+
+    # The first model's eval is done and drops the prompt before the second one starts
+    get_prompt("v1")
+    gc.collect()
+    get_prompt("v1")
+    assert builds == ["v1"]
+
+    release()
+    release()
+    gc.collect()
+    get_prompt("v1")
+    assert builds == ["v1", "v1"]
+
+
+def test_models_running_apart_share_the_prompt(builds):
+    scheduler = EvalScheduler(concurrency=4, report_interval=60)
+    models = ["fast", "slow"]
+
+    async def evaluate(model):
+        if model == "slow":
+            await asyncio.sleep(0.2)
+        get_prompt("v1")
+        gc.collect()
+        return {"passed": True}
+
+    async def main():
+        release = run_eval.hold_eval_prompt("project", "page", "v1", DEFAULT_IMAGE_PROFILE, len(models))
+        for model in models:
+            scheduler.submit(f"v1 ({model})", model, lambda budget, model=model: evaluate(model), on_done=release)
+        scheduler.close()
+        await scheduler.run()
+
+    asyncio.run(main())
+    assert builds == ["v1"]
+    assert not run_eval._held_eval_prompts
+
+
+def test_on_done_runs_once_after_retries():
+    scheduler = EvalScheduler(concurrency=2, max_retries=2, retry_delay=0.01, report_interval=60)
+    attempts = []
+    done = []
+
+    async def flaky(budget):
+        attempts.append(1)
+        return {"passed": False, "error_code": "api_error"} if len(attempts) < 3 else {"passed": True}
+
+    async def main():
+        scheduler.submit("job", "model", flaky, on_done=lambda: done.append(1))
+        scheduler.close()
+        await scheduler.run()
+
+    asyncio.run(main())
+    assert len(attempts) == 3
+    assert done == [1]
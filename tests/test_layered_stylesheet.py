@@ -0,0 +1,64 @@
+from copy import deepcopy
+import pytest
+from my_types import LayeredStyleSheet
+from utils import apply_css_changes
+
+BASE = {
+    ".header": {"color": "black", "margin-top": "8px"},
+    ".title": {"font-size": "16px"},
+    ".footer": {"padding": "4px"},
+}
+VARIANT = {".header": {"color": "red"}, ".title": {"font-weight": "700"}}
+RESPONSE = {".header": {"color": "black"}, ".title": {"font-weight": "400"}, ".new": {"gap": "2px"}}
+
+
+def applied(reference_css, *changes):
+    """What apply_css_changes returned before it was layered: a copy updated one change set at a time"""
+    result = deepcopy(reference_css)
+    for change_set in changes:
+        for selector, properties in change_set.items():
+            result.setdefault(selector, {}).update(properties)
+    return result
+
+
+def plain_diff(ours, theirs):
+    keys = dict.fromkeys((selector, prop) for stylesheet in (ours, theirs) for selector in stylesheet for prop in stylesheet[selector])
+    differences = {}
+    for selector, prop in keys:
+        values = ours.get(selector, {}).get(prop), theirs.get(selector, {}).get(prop)
+        if values[0] != values[1]:
+            differences[(selector, prop)] = values
+    return differences
+
+
+@pytest.mark.parametrize("changes", [(), (VARIANT,), (VARIANT, RESPONSE), (RESPONSE, VARIANT)])
+def test_materialize_matches_applied_changes(changes):
+    materialized = apply_css_changes(BASE, *changes).materialize()
+
+    assert materialized == applied(BASE, *changes)
+    # Same order of selectors and properties, so the generated CSS is the same
+    assert [(selector, list(properties)) for selector, properties in materialized.items()] == \
+        [(selector, list(properties)) for selector, properties in applied(BASE, *changes).items()]
+    # Plain dicts, detached from the base and the change sets
+    materialized[".header"]["color"] = "blue"
+    assert BASE[".header"]["color"] == "black"
+
+
+@pytest.mark.parametrize("ours, theirs", [
+    ((VARIANT,), (VARIANT, RESPONSE)),
+    ((), (VARIANT,)),
+    ((VARIANT, RESPONSE), (VARIANT, RESPONSE)),
+])
+def test_diff_with_shared_base_matches_plain_diff(ours, theirs):
+    layered_ours, layered_theirs = apply_css_changes(BASE, *ours), apply_css_changes(BASE, *theirs)
+    assert layered_ours.diff(layered_theirs) == plain_diff(applied(BASE, *ours), applied(BASE, *theirs))
+
+
+def test_diff_with_different_bases_matches_plain_diff():
+    other_base = deepcopy(BASE)
+    other_base[".footer"]["padding"] = "8px"
+    del other_base[".title"]
+
+    ours = apply_css_changes(BASE, VARIANT)
+    theirs = LayeredStyleSheet(other_base, RESPONSE)
+    assert ours.diff(theirs) == plain_diff(applied(BASE, VARIANT), applied(other_base, RESPONSE))
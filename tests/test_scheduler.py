@@ -0,0 +1,24 @@
+import asyncio
+import time
+import pytest
+from scheduler import ModelBudget
+
+
+def run_concurrently(budget, method, count):
+    async def main():
+        await asyncio.gather(*[getattr(budget, method)() for _ in range(count)])
+
+    start = time.monotonic()
+    asyncio.run(main())
+    return time.monotonic() - start
+
+
+@pytest.mark.parametrize("method", ["spend", "reserve"])
+def test_waited_sums_concurrent_callers(method):
+    budget = ModelBudget(rps=5)
+
+    # The first 5 requests use up the bucket, the other 5 go through 0.2s apart
+    elapsed = run_concurrently(budget, method, 10)
+
+    assert elapsed == pytest.approx(1.0, abs=0.2)
+    assert budget.waited == pytest.approx(elapsed, abs=0.1)
@@ -0,0 +1,34 @@
+import asyncio
+import sys
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+# run_test.py uses f-string syntax that needs Python 3.12
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 12), reason="text_image_order_bench/run_test.py needs Python 3.12+")
+
+
+def test_breaker_wait_sums_concurrent_waiters(monkeypatch):
+    from text_image_order_bench import run_test
+
+    async def reply(request):
+        return web.json_response({"choices": [{"message": {"content": '{"all_labels_correct": true}'}}]})
+
+    async def main():
+        app = web.Application()
+        app.router.add_post("/chat/completions", reply)
+        async with TestServer(app) as server:
+            monkeypatch.setattr(run_test, "OPENROUTER_BASE_URL", str(server.make_url("")).rstrip("/"))
+            monkeypatch.setattr(run_test, "BREAKER_JITTER", 0)
+            monkeypatch.setattr(run_test, "backoff_stats", {"retries": 0, "backoff": 0.0, "breaker_wait": 0.0})
+            monkeypatch.setattr(run_test, "circuit_breakers", run_test.defaultdict(run_test.CircuitBreaker))
+
+            run_test.circuit_breakers["m"].trip(0.5)
+            async with run_test.create_session() as session:
+                results = await asyncio.gather(*[run_test.call_model_with_retry([], "m", session) for _ in range(20)])
+
+        assert all(result.get("success") for result in results)
+        # Every call waited about 0.5s on the open breaker
+        assert run_test.backoff_stats["breaker_wait"] == pytest.approx(20 * 0.5, abs=0.5)
+
+    asyncio.run(main())
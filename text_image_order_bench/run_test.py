@@ -7,11 +7,28 @@ import json
 import asyncio
 import aiohttp
 import time
+import random
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from utils import extract_json_from_response
 from text_image_order_bench.shared import ANIMALS_DICT
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-RATE_LIMIT_DELAY = 10  # seconds to wait when rate limited
+
+# Point at a local stand-in (see mock_server.py) to run the benchmark offline
+OPENROUTER_BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Retries wait a random time up to BACKOFF_BASE * 2^attempt seconds (capped at
+# BACKOFF_MAX), unless the provider says how long to wait with Retry-After
+BACKOFF_BASE = 2
+BACKOFF_MAX = 60
+BREAKER_JITTER = 2  # seconds, spread of calls released by a circuit breaker
+
+# One session per run: at most MAX_CONNECTIONS sockets, kept alive between requests
+MAX_CONNECTIONS = 20
+KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
 
 def create_message_content(test_items):
     """Create a message content with interleaved text and images."""
@@ -47,7 +64,112 @@ def create_message_content(test_items):
 
 
 
-async def call_model_with_retry(content, model, max_retries=5):
+class CircuitBreaker:
+    """
+    Shared by all calls to one model. While the provider is throttling it, new
+    calls wait until the breaker closes again instead of piling more requests on.
+    """
+
+    def __init__(self):
+        self.open_until = 0.0
+
+    def trip(self, delay):
+        self.open_until = max(self.open_until, time.monotonic() + delay)
+
+    async def wait(self):
+        delay = self.open_until - time.monotonic()
+        if delay <= 0:
+            return 0.0
+        # Spread the waiting calls out instead of releasing them all at once
+        delay += random.uniform(0, BREAKER_JITTER)
+        await asyncio.sleep(delay)
+        return delay
+
+
+circuit_breakers = defaultdict(CircuitBreaker)
+
+# Seconds spent sleeping before retries and waiting on open circuit breakers
+backoff_stats = {"retries": 0, "backoff": 0.0, "breaker_wait": 0.0}
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (seconds or HTTP date), None if missing or invalid"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Retry-After if the provider sent one, otherwise exponential backoff with full jitter"""
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _now():
+    return asyncio.get_running_loop().time()
+
+async def _on_request_start(session, ctx, params):
+    timings = ctx.trace_request_ctx
+    timings["start"] = _now()
+    timings["connection_wait"] = 0.0
+    timings["connect"] = 0.0
+    timings["reused_connection"] = False
+
+async def _on_connection_queued_start(session, ctx, params):
+    ctx.trace_request_ctx["queued_at"] = _now()
+
+async def _on_connection_queued_end(session, ctx, params):
+    timings = ctx.trace_request_ctx
+    timings["connection_wait"] += _now() - timings.pop("queued_at")
+
+async def _on_connection_create_start(session, ctx, params):
+    ctx.trace_request_ctx["connecting_at"] = _now()
+
+async def _on_connection_create_end(session, ctx, params):
+    timings = ctx.trace_request_ctx
+    timings["connect"] += _now() - timings.pop("connecting_at")
+
+async def _on_connection_reuseconn(session, ctx, params):
+    ctx.trace_request_ctx["reused_connection"] = True
+
+async def _on_request_end(session, ctx, params):
+    # Fired once the response headers arrived
+    timings = ctx.trace_request_ctx
+    timings["ttfb"] = _now() - timings["start"]
+
+def create_session():
+    """Session shared by all requests of a run, with a bounded keep-alive connection pool and DNS cache"""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_connection_queued_start.append(_on_connection_queued_start)
+    trace_config.on_connection_queued_end.append(_on_connection_queued_end)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_request_end.append(_on_request_end)
+
+    connector = aiohttp.TCPConnector(
+        limit=MAX_CONNECTIONS,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+
+def request_timings(timings):
+    """Timings of one attempt in seconds, as stored in the test result"""
+    report = {key: round(timings[key], 4) for key in ("connection_wait", "connect", "ttfb", "total") if key in timings}
+    report["reused_connection"] = timings.get("reused_connection", False)
+    return report
+
+async def call_model_with_retry(content, model, session, max_retries=5):
     """Call the model with retry logic for rate limiting."""
     headers = {
         "Authorization": f"Bearer {os.environ.get('OPENROUTER_API_KEY')}",
@@ -63,45 +185,80 @@ async def call_model_with_retry(content, model, max_retries=5):
             }
         ]
     }
-    
+
+    breaker = circuit_breakers[model]
+
+    async def back_off(delay):
+        backoff_stats["retries"] += 1
+        backoff_stats["backoff"] += delay
+        await asyncio.sleep(delay)
+
+    # Timings of every attempt, returned with the result
+    attempts = []
+
+    def with_timings(result):
+        result["timings"] = [request_timings(timings) for timings in attempts]
+        return result
+
     retries = 0
     while retries <= max_retries:
+        # Await before adding, other calls update the total while this one waits
+        waited = await breaker.wait()
+        backoff_stats["breaker_wait"] += waited
+
+        timings = {}
+        attempts.append(timings)
+
         try:
-            async with aiohttp.ClientSession() as client:
-                async with client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers=headers,
-                    json=payload
-                ) as response:
-                    response_data = await response.json()
-
-                    # Check if there's an error in the response
-                    if "error" in response_data:
-                        error_code = response_data["error"].get("code")
-                        error_message = response_data["error"].get("message", "Unknown API error")
-                        
-                        # Handle rate limiting
-                        if error_code == 429:
-                            retries += 1
-                            if retries <= max_retries:
-                                print(f"Rate limited for model {model}. Retrying in {RATE_LIMIT_DELAY}s... (Attempt {retries}/{max_retries})")
-                                await asyncio.sleep(RATE_LIMIT_DELAY)
-                                continue
-                            else:
-                                return {"error": "rate_limit", "message": error_message}
-                        else:
-                            return {"error": "api_error", "message": error_message}
-                    
-                    return {"success": True, "content": response_data["choices"][0]["message"]["content"]}
+            async with session.post(
+                f"{OPENROUTER_BASE_URL}/chat/completions",
+                headers=headers,
+                json=payload,
+                trace_request_ctx=timings,
+            ) as response:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                status = response.status
+                try:
+                    response_data = await response.json(content_type=None)
+                except ValueError:
+                    # Rate limit responses don't always come with a JSON body
+                    if status != 429:
+                        raise
+                    response_data = {"error": {"message": (await response.text())[:200] or "Rate limited"}}
+            timings["total"] = _now() - timings["start"]
+
+            # Check if there's an error in the response
+            if status == 429 or "error" in response_data:
+                error = response_data.get("error", {})
+                error_code = error.get("code", status)
+                error_message = error.get("message", "Unknown API error")
+
+                # Handle rate limiting (after the response is released, so its connection can be reused)
+                if status == 429 or error_code == 429:
+                    retries += 1
+                    if retries <= max_retries:
+                        delay = backoff_delay(retries - 1, retry_after)
+                        # Hold back the other calls to this model for as long as this one waits
+                        breaker.trip(delay)
+                        print(f"Rate limited for model {model}. Retrying in {delay:.1f}s... (Attempt {retries}/{max_retries})")
+                        await back_off(delay)
+                        continue
+                    else:
+                        return with_timings({"error": "rate_limit", "message": error_message})
+                else:
+                    return with_timings({"error": "api_error", "message": error_message})
+
+            return with_timings({"success": True, "content": response_data["choices"][0]["message"]["content"]})
         except Exception as e:
             retries += 1
             if retries <= max_retries:
-                print(f"Error during API call for model {model}: {e}. Retrying in {RATE_LIMIT_DELAY}s... (Attempt {retries}/{max_retries})")
-                await asyncio.sleep(RATE_LIMIT_DELAY)
+                delay = backoff_delay(retries - 1)
+                print(f"Error during API call for model {model}: {e}. Retrying in {delay:.1f}s... (Attempt {retries}/{max_retries})")
+                await back_off(delay)
             else:
-                return {"error": "max_retries_exceeded", "message": str(e)}
+                return with_timings({"error": "max_retries_exceeded", "message": str(e)})
     
-    return {"error": "max_retries_exceeded", "message": "Maximum retries exceeded"}
+    return with_timings({"error": "max_retries_exceeded", "message": "Maximum retries exceeded"})
 
 async def process_model_response(model_response_data, reference_correct: bool):
     """Process the model response and handle potential errors."""
@@ -148,20 +305,21 @@ async def process_model_response(model_response_data, reference_correct: bool):
             "model_correct": False
         }
 
-async def run_test_for_model(test_case, model):
+async def run_test_for_model(test_case, model, session):
     """Run a single test case for a specific model."""
     # Create the message content
     content = create_message_content(test_case["items"])
     
     # Call the model with retry logic
-    model_response_data = await call_model_with_retry(content, model)
+    model_response_data = await call_model_with_retry(content, model, session)
     
     # Process the response
     result = await process_model_response(model_response_data, test_case["correct"])
     
     output = {
         **test_case,
-        "result": result
+        "result": result,
+        "timings": model_response_data["timings"]
     }
 
     id = test_case["id"]
@@ -174,39 +332,47 @@ async def run_test_for_model(test_case, model):
     
     return output
 
-async def run_tests(model_id):
-    """Run all tests for the specified model."""
-    
-    # Load test cases from JSON file
-    print("Loading test cases...")
-    test_cases_path = os.path.join(ROOT_DIR, "test_cases.json")
-    with open(test_cases_path, "r") as f:
-        test_cases = json.load(f)
-    print(f"Loaded {len(test_cases)} test cases successfully.")
-    
-    # Run all test cases for the specified model
-    print(f"Running {len(test_cases)} test cases for model {model_id}...")
-    tasks = []
-    for test_case in test_cases:
-        task = run_test_for_model(test_case,  model_id)
-        tasks.append(task)
-    
-    # Wait for all tasks to complete
-    results = await asyncio.gather(*tasks)
-    
-    # Create results directory if it doesn't exist
-    results_dir = os.path.join(ROOT_DIR, "results")
-    os.makedirs(results_dir, exist_ok=True)
-    
-    # Create model-specific directory
-    model_dir = os.path.join(results_dir, model_id.replace('/', '_'))
-    os.makedirs(model_dir, exist_ok=True)
-    
+def load_results(model_dir):
+    """
+    Latest result of every test id, from results.json of earlier runs overlaid
+    with the results.jsonl log. A line cut short by an interrupted run is ignored.
+    """
+    results = {}
+
+    results_file = os.path.join(model_dir, "results.json")
+    if os.path.exists(results_file):
+        with open(results_file, "r") as f:
+            for output in json.load(f):
+                results[output["id"]] = output
+
+    log_file = os.path.join(model_dir, "results.jsonl")
+    if os.path.exists(log_file):
+        with open(log_file, "r") as f:
+            for line in f:
+                try:
+                    output = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                results[output["id"]] = output
+
+    return results
+
+def compact_results(model_id, model_dir, test_cases):
+    """Write results.json and summary.txt from the log, and rewrite the log with only the latest result of every test."""
+    latest = load_results(model_dir)
+    results = [latest[test_case["id"]] for test_case in test_cases if test_case["id"] in latest]
+
     # Save results to file
     results_file = os.path.join(model_dir, "results.json")
     with open(results_file, "w") as f:
         json.dump(results, f, indent=4)
-    
+
+    log_file = os.path.join(model_dir, "results.jsonl")
+    with open(log_file + ".tmp", "w") as f:
+        for output in results:
+            f.write(json.dumps(output) + "\n")
+    os.replace(log_file + ".tmp", log_file)
+
     # Generate summary
     correct_count = sum(1 for r in results if r.get("result", {}).get("model_correct", False))
     success_count = sum(1 for r in results if r.get("result", {}).get("success", False))
@@ -216,6 +382,7 @@ async def run_tests(model_id):
     summary += f"  Total tests: {len(results)}\n"
     summary += f"  Successful tests: {success_count} ({success_count / len(results):.2%})\n"
     summary += f"  Correct tests: {correct_count} ({correct_count / len(results):.2%})\n"
+    summary += f"  Retries: {backoff_stats['retries']}, backing off: {backoff_stats['backoff']:.1f}s, waiting on circuit breaker: {backoff_stats['breaker_wait']:.1f}s (last run)\n"
     summary += f"\nResults saved to results/{model_id.replace('/', '_')}/results.json"
     
     # Print summary
@@ -230,6 +397,54 @@ async def run_tests(model_id):
     
     return results
 
+async def run_tests(model_id):
+    """
+    Run all tests for the specified model.
+
+    Every result is appended to results/<model>/results.jsonl as soon as it
+    completes, and tests that already have a successful result there are
+    skipped, so an interrupted run can be resumed. results.json and
+    summary.txt are produced from the log at the end.
+    """
+    
+    # Load test cases from JSON file
+    print("Loading test cases...")
+    test_cases_path = os.path.join(ROOT_DIR, "test_cases.json")
+    with open(test_cases_path, "r") as f:
+        test_cases = json.load(f)
+    print(f"Loaded {len(test_cases)} test cases successfully.")
+
+    # Create model-specific results directory if it doesn't exist
+    model_dir = os.path.join(ROOT_DIR, "results", model_id.replace('/', '_'))
+    os.makedirs(model_dir, exist_ok=True)
+
+    done = {id for id, output in load_results(model_dir).items() if output.get("result", {}).get("success", False)}
+    pending = [test_case for test_case in test_cases if test_case["id"] not in done]
+    if len(pending) < len(test_cases):
+        print(f"Skipping {len(test_cases) - len(pending)} test cases with a successful result.")
+    
+    # Run remaining test cases for the specified model
+    print(f"Running {len(pending)} test cases for model {model_id}...")
+    log_file = os.path.join(model_dir, "results.jsonl")
+    with open(log_file, "a+") as log:
+        # Don't append to a line cut short by an interrupted run
+        if log.tell() > 0:
+            log.seek(log.tell() - 1)
+            if log.read(1) != "\n":
+                log.write("\n")
+
+        async def run_and_log(test_case, session):
+            output = await run_test_for_model(test_case, model_id, session)
+            log.write(json.dumps(output) + "\n")
+            log.flush()
+            return output
+
+        async with create_session() as session:
+            # Wait for all tasks to complete
+            await asyncio.gather(*[run_and_log(test_case, session) for test_case in pending])
+
+    return compact_results(model_id, model_dir, test_cases)
+
 def keep_program_running():
     """Keep the program running after tests are completed."""
     print("\nTests completed. Program will remain running until manually stopped.")
@@ -1,4 +1,4 @@
-from utils import read_and_encode_image
+from utils import image_data_url
 import os 
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -7,15 +7,12 @@ class Animal:
     def __init__(self, id):
         self.id = id
         self.label = id.capitalize()
-        self.image_url = None
-        # Encode the image in the constructor
-        self.encode_image()
-    
-    def encode_image(self):
-        """Encode the image for this animal"""
-        image_path = os.path.join(ROOT_DIR, "images", f"{self.id}.png")
-        encoded_image = read_and_encode_image(image_path)
-        self.image_url = f"data:image/png;base64,{encoded_image}"
+        self.image_path = os.path.join(ROOT_DIR, "images", f"{self.id}.png")
+
+    @property
+    def image_url(self):
+        """Data URL of the animal's image, encoded on first use and shared through the process-wide cache"""
+        return image_data_url(self.image_path, "image/png")
         
 
 # Global animals list
@@ -26,4 +23,4 @@ ANIMALS = [
     Animal("pig")
 ]
 
-ANIMALS_DICT = {animal.id: animal for animal in ANIMALS}
\ No newline at end of file
+ANIMALS_DICT = {animal.id: animal for animal in ANIMALS}
@@ -1,27 +1,36 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-import base64
+import hashlib
 import json
 import os
 from bs4 import BeautifulSoup
-from my_types import Config, StyleSheet
-from copy import deepcopy
+from my_types import Config, LayeredStyleSheet, StyleSheet
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 import re
 import html
+import shutil
 from langfuse.openai import openai    
 from playwright.sync_api import sync_playwright
 from playwright.async_api import async_playwright
 import asyncio
+import contextvars
+import httpx
+import itertools
+import posixpath
 import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from assets import ASSET_BASE_URL, data_url_cache, fulfill_from_disk
+from response_cache import response_cache
+from scheduler import estimate_prompt_tokens
 
 
-# Function to encode the image
-def read_and_encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+def image_data_url(image_path, mime_type=None):
+    """Base64 data URL of an image, encoded once per process (see assets.DataUrlCache)"""
+    return data_url_cache.data_url(image_path, mime_type)
 
 def extract_json_from_response(response_text):
     # Try to find JSON block between code fence markers first
@@ -69,7 +78,7 @@ def generate_css_string(styles):
     return "\n" + "\n".join(css) + "\n"
 
 
-def generate_html(project_id: str, page_id: str, styles: StyleSheet):
+def _prettify_page(project_id: str, page_id: str, page_css: str):
     # Read page.html
     page_path = os.path.join("data", project_id, "pages", page_id, "page.html")
     with open(page_path) as f:
@@ -77,7 +86,7 @@ def generate_html(project_id: str, page_id: str, styles: StyleSheet):
     
     # Find style tag and insert CSS
     style_tag = soup.find('style', id='page-styles')
-    style_tag.string = generate_css_string(styles)
+    style_tag.string = page_css
 
     # Add global CSS styles
     global_css_path = os.path.join("data", project_id, "global.css")
@@ -98,54 +107,146 @@ def generate_html(project_id: str, page_id: str, styles: StyleSheet):
     return soup.prettify()
 
 
-def apply_css_changes(reference_css: StyleSheet, *changes: StyleSheet) -> StyleSheet:
-    # Create deep copy of reference to avoid modifying original
-    result = deepcopy(reference_css)
-    
-    # Apply each set of changes in order
-    for change_set in changes:
-        for selector, css_props in change_set.items():
-            if selector in result:
-                result[selector].update(css_props)
-            else:
-                # If selector doesn't exist, add it
-                result[selector] = css_props
-                
-    return result
+class PageTemplate:
+    """
+    A page prettified once with global.css inlined, split around the contents of #page-styles.
+
+    prettify() writes the stripped contents of the style tag on their own,
+    indented line (or nothing at all if they're empty), so splicing the CSS in
+    gives the same output as prettifying the page with that CSS.
+    """
+
+    SENTINEL = "@@PAGE_STYLES@@"
+
+    def __init__(self, project_id: str, page_id: str):
+        html = _prettify_page(project_id, page_id, f"\n{self.SENTINEL}\n")
+        before, after = html.split(self.SENTINEL)
+
+        self.prefix = before
+        self.suffix = after
+
+        # Without CSS the whole indented line is left out
+        self.empty = before[:before.rindex("\n")] + after
+
+    def render(self, styles: StyleSheet) -> str:
+        page_css = generate_css_string(styles).strip()
+        if not page_css:
+            return self.empty
+        return self.prefix + page_css + self.suffix
+
+
+# Compiled templates by (project_id, page_id), with the mtimes they were compiled from
+_page_templates = {}
+
+def get_page_template(project_id: str, page_id: str) -> PageTemplate:
+    page_path = os.path.join("data", project_id, "pages", page_id, "page.html")
+    global_css_path = os.path.join("data", project_id, "global.css")
+    version = (os.stat(page_path).st_mtime_ns, os.stat(global_css_path).st_mtime_ns if os.path.exists(global_css_path) else None)
+
+    cached = _page_templates.get((project_id, page_id))
+    if cached is None or cached[0] != version:
+        cached = (version, PageTemplate(project_id, page_id))
+        _page_templates[(project_id, page_id)] = cached
+
+    return cached[1]
+
+
+def generate_html(project_id: str, page_id: str, styles: StyleSheet):
+    return get_page_template(project_id, page_id).render(styles)
+
+
+def apply_css_changes(reference_css: StyleSheet, *changes: StyleSheet) -> LayeredStyleSheet:
+    # Stack change sets on top of the reference, later ones win. Nothing is copied or modified.
+    return LayeredStyleSheet(reference_css, *changes)
+
+
+# Durations of timed stages, by stage name
+stage_timings = defaultdict(list)
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_timings[stage].append(time.perf_counter() - start)
+
+def print_timings():
+    for stage, durations in sorted(stage_timings.items()):
+        total = sum(durations)
+        print(f"[timing] {stage}: {len(durations)} calls, total: {total:.3f}s, avg: {total / len(durations):.3f}s, max: {max(durations):.3f}s")
+
+
+DEFAULT_VIEWPORT = {"width": 1536, "height": 100}
+
+# In-memory documents are served under a file name carrying their render token
+RENDER_PATTERN = re.compile(r"/__render_(\d+)__[^/]*$")
 
 
 class BrowserManager:
-    def __init__(self, max_concurrent_pages=10):
+    """
+    Pool of warm browser slots (context + page) shared by all render jobs.
+
+    Slots are handed out through a FIFO queue, so waiters are woken in arrival
+    order as soon as a slot is released. A slot's context and page are created
+    on first use and reset (blank page, default viewport, no cookies) between
+    jobs instead of being torn down.
+
+    Unless `serve_assets` is disabled, every request to ASSET_BASE_URL is
+    fulfilled from `data/` on disk, so no external static server is needed.
+    Pages can also be rendered from an HTML string without writing it to disk.
+    """
+
+    def __init__(self, max_concurrent_pages=10, serve_assets=True):
         self.playwright = None
         self.browser = None
         self.max_concurrent_pages = max_concurrent_pages
+        self.serve_assets = serve_assets
         self.active_pages = 0
         self._initialized = False
-    
+        self._init_lock = asyncio.Lock()
+        self._idle_slots = None
+        self._documents = {}
+        self._render_ids = itertools.count()
+
+        # Pool statistics
+        self.jobs = 0
+        self.peak_active_pages = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def set_pool_size(self, size):
+        if self._initialized:
+            raise RuntimeError("Pool size must be set before the browser is started")
+        self.max_concurrent_pages = size
+
     async def initialize(self):
-        if not self._initialized:
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(headless=True)
-            self._initialized = True
+        async with self._init_lock:
+            if not self._initialized:
+                self.playwright = await async_playwright().start()
+                self.browser = await self.playwright.chromium.launch(headless=True)
+
+                # Every slot starts empty and gets its context and page on first use
+                self._idle_slots = asyncio.Queue()
+                for _ in range(self.max_concurrent_pages):
+                    self._idle_slots.put_nowait(None)
+
+                self._initialized = True
     
     async def close(self):
         if self._initialized:
             await self.browser.close()
             await self.playwright.stop()
             self._initialized = False
+            self._idle_slots = None
             self.active_pages = 0
-    
-    async def get_page(self, path):
-        await self.initialize()
-        
-        # Wait for a page slot to become available
-        while self.active_pages >= self.max_concurrent_pages:
-            await asyncio.sleep(1)  # Simple sleep instead of semaphore
-        
-        self.active_pages += 1
-        
+
+    async def _create_slot(self):
         # Create context with viewport size
-        context = await self.browser.new_context(viewport={"width": 1536, "height": 100})
+        context = await self.browser.new_context(viewport=DEFAULT_VIEWPORT)
+
+        # Serve in-memory documents, and pages, fonts and images straight from disk
+        await context.route(f"{ASSET_BASE_URL}/**", self._route)
         
         # Create page and set up console error logging
         page = await context.new_page()
@@ -158,30 +259,141 @@ class BrowserManager:
         
         # Log request failures
         page.on("requestfailed", lambda request: print(f"Request failed: {request.url} - {request.failure}"))
+
+        return context, page
+
+    async def _reset_slot(self, slot):
+        context, page = slot
+        await page.goto("about:blank")
+        await page.set_viewport_size(DEFAULT_VIEWPORT)
+        await context.clear_cookies()
+
+    async def _discard_slot(self, slot):
+        context, _ = slot
+        try:
+            await context.close()
+        except Exception:
+            pass
+
+    async def _route(self, route):
+        # In-memory documents take precedence over files on disk
+        match = RENDER_PATTERN.search(urlsplit(route.request.url).path)
+        if match:
+            document = self._documents.get(match.group(1))
+            if document is None:
+                # Fail the navigation rather than render something else in its place
+                print(f"[browser] no in-memory document for {route.request.url}")
+                await route.abort()
+            else:
+                await route.fulfill(status=200, body=document, content_type="text/html; charset=utf-8")
+        elif self.serve_assets:
+            await fulfill_from_disk(route)
+        else:
+            await route.continue_()
+
+    async def get_page(self, path, html=None):
+        """
+        Open `path` (relative to `data/`) in a pooled page.
+
+        If `html` is given, it's served in place of the file at `path`, which then
+        only sets the base URL for the page's assets.
+
+        Returns (page, release_page, navigation_error). A page that failed to load
+        (e.g. timed out) is still returned, with the error instead of None.
+        """
+        await self.initialize()
+        
+        # Wait for a page slot to become available
+        wait_start = time.perf_counter()
+        slot = await self._idle_slots.get()
+        wait_time = time.perf_counter() - wait_start
+
+        self.jobs += 1
+        self.active_pages += 1
+        self.peak_active_pages = max(self.peak_active_pages, self.active_pages)
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        if slot is None:
+            try:
+                slot = await self._create_slot()
+            except Exception:
+                self.active_pages -= 1
+                self._idle_slots.put_nowait(None)
+                raise
+
+        context, page = slot
         
         # Navigate to the page
-        url = f"http://localhost:8000/{path}"
+        url = f"{ASSET_BASE_URL}/{path}"
+        document_token = None
+        if html is not None:
+            # Unique file name per render, so concurrent renders of the same path don't
+            # collide. It stays in the same directory, so relative asset URLs still resolve.
+            document_token = str(next(self._render_ids))
+            directory, name = posixpath.split(path)
+            url = f"{ASSET_BASE_URL}/{posixpath.join(directory, f'__render_{document_token}__{name}')}"
+            self._documents[document_token] = html
+
+        navigation_error = None
         try:
             await page.goto(url, wait_until="networkidle")
         except Exception as e:
             print(f"Navigation error for {url}: {str(e)}")
+            navigation_error = e
+        finally:
+            self._documents.pop(document_token, None)
 
         # Return page along with a release function
         async def release_page():
-            await page.close()
-            await context.close()
-            self.active_pages -= 1
+            try:
+                await self._reset_slot(slot)
+                self._idle_slots.put_nowait(slot)
+            except Exception as e:
+                # Broken slot (e.g. crashed page), it will be recreated on next use
+                print(f"Browser slot reset failed: {e}")
+                await self._discard_slot(slot)
+                self._idle_slots.put_nowait(None)
+            finally:
+                self.active_pages -= 1
         
-        return page, release_page
+        return page, release_page, navigation_error
+
+    def stats(self):
+        return {
+            "pool_size": self.max_concurrent_pages,
+            "active_pages": self.active_pages,
+            "peak_active_pages": self.peak_active_pages,
+            "jobs": self.jobs,
+            "total_wait_time": self.total_wait_time,
+            "avg_wait_time": self.total_wait_time / self.jobs if self.jobs else 0.0,
+            "max_wait_time": self.max_wait_time,
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(
+            f"[browser] pool size: {stats['pool_size']}, peak occupancy: {stats['peak_active_pages']}, "
+            f"jobs: {stats['jobs']}, wait avg: {stats['avg_wait_time']:.3f}s, max: {stats['max_wait_time']:.3f}s, "
+            f"total: {stats['total_wait_time']:.3f}s"
+        )
 
 # Create a singleton instance
 browser_manager = BrowserManager()
 
-async def render_html(path):
-    """Render HTML file and save screenshot with same basename"""
+async def render_html(path, html=None, screenshot_path=None):
+    """
+    Render HTML file and save screenshot with same basename.
+
+    If `html` is given, it's rendered from memory under the URL of `path` and
+    nothing needs to exist on disk at `path`.
+
+    Returns False if the page failed to load. The screenshot is still saved
+    then, but it shouldn't be treated as up to date.
+    """
     
     # Get page and release function
-    page, release_page = await browser_manager.get_page(path)
+    page, release_page, navigation_error = await browser_manager.get_page(path, html)
     
     try:
         # Get total height of page by getting scrollHeight of document element
@@ -193,110 +405,365 @@ async def render_html(path):
         await page.set_viewport_size({"width": 1536, "height": total_height})
         
         # Save screenshot with same basename but .png extension
-        base_filename = os.path.splitext(path)[0]
-        screenshot_path = os.path.join("data", f"{base_filename}.png")
+        if screenshot_path is None:
+            base_filename = os.path.splitext(path)[0]
+            screenshot_path = os.path.join("data", f"{base_filename}.png")
+        os.makedirs(os.path.dirname(screenshot_path), exist_ok=True)
         
         await page.screenshot(path=screenshot_path, full_page=True, scale="device")
     finally:
         # Always release the page when done
         await release_page()
 
+    return navigation_error is None
+
         
-async def get_computed_css(path):
-    # Get page and release function
-    page, release_page = await browser_manager.get_page(path)
-    
-    try:
-        # Get the HTML content
-        html_content = await page.content()
-        
-        # Use read_page_styles to extract selectors and properties
-        stylesheet = read_page_styles(html_content)
-        
-        computed_values = {}
+# Collects the computed values of every selector's properties in a single call
+COMPUTED_STYLES_SCRIPT = """
+    (selectors) => {
+        let computedValues = {};
+
+        selectors.forEach(([selector, properties]) => {
+            // First matching element only, selectors without elements are skipped
+            let element = document.querySelector(selector);
+            if (!element) {
+                return;
+            }
+
+            let computedStyle = window.getComputedStyle(element);
+            let values = {};
+
+            properties.forEach((prop) => {
+                values[prop] = computedStyle.getPropertyValue(prop);
+            });
+
+            computedValues[selector] = values;
+        });
+
+        return computedValues;
+    }
+"""
+
+async def get_computed_css(path, html=None):
+    with timed("computed_css"):
+        # Get page and release function
+        page, release_page, navigation_error = await browser_manager.get_page(path, html)
         
-        for selector, properties in stylesheet.items():
-            # Check if elements exist for this selector
-            elements = await page.query_selector_all(selector)
-            
-            if not elements or len(elements) == 0:
-                continue
-                
-            # Get first matching element's computed style
-            computed_style = await page.evaluate("""
-                (arg) => {
-                    const [element, properties] = arg;
-                    let computedStyle = window.getComputedStyle(element);
-                    let values = {};
-                    
-                    properties.forEach((prop) => {
-                        values[prop] = computedStyle.getPropertyValue(prop);
-                    });
-                    
-                    return values;
-                }
-            """, [elements[0], list(properties.keys())])
+        try:
+            # Get the HTML content, unless it's rendered from memory
+            html_content = html if html is not None else await page.content()
             
-            computed_values[selector] = computed_style
+            # Use read_page_styles to extract selectors and properties
+            stylesheet = read_page_styles(html_content)
             
-        return computed_values
-    finally:
-        # Always release the page when done
-        await release_page()
+            # Get computed values of all selectors in one round trip
+            with timed("computed_css.extract"):
+                return await page.evaluate(
+                    COMPUTED_STYLES_SCRIPT,
+                    [[selector, list(properties.keys())] for selector, properties in stylesheet.items()]
+                )
+        finally:
+            # Always release the page when done
+            await release_page()
 
 
 
 
-def read_page_styles(html_content) -> StyleSheet:
+def update_file_hash(content_hash, path: str):
+    """Add a file's path and content (nothing if it's missing) to `content_hash`"""
+    content_hash.update(path.encode("utf-8") + b"\0")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            content_hash.update(f.read())
+    content_hash.update(b"\0")
 
-    # Parse HTML
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
-    # Find the page-styles stylesheet
-    page_styles = soup.select_one('#page-styles')
-    if not page_styles:
-        return {}  # Return empty stylesheet if not found
-    
-    # Extract CSS rules
-    css_text = page_styles.string
-    
-    # Remove comments
-    css_text = re.sub(r'/\*.*?\*/', '', css_text, flags=re.DOTALL)
-    
-    stylesheet: StyleSheet = {}
-    # Find all CSS rule blocks
-    pattern = r'([^\{\}]+)\s*\{([^\{\}]*)\}'
-    matches = re.findall(pattern, css_text)
-    
-    for selector, properties_text in matches:
-        selector = selector.strip()
-        
-        # Skip if selector is empty
-        if not selector:
+
+def page_content_hash(project_id: str, page_id: str) -> str:
+    """Hash of everything the reference page is built from: page.html, the project's global.css and config.json"""
+    page_dir = os.path.join("data", project_id, "pages", page_id)
+    paths = [
+        os.path.join(page_dir, "page.html"),
+        os.path.join("data", project_id, "global.css"),
+        os.path.join(page_dir, "config.json"),
+    ]
+
+    content_hash = hashlib.sha256()
+    for path in paths:
+        update_file_hash(content_hash, path)
+    return content_hash.hexdigest()
+
+
+# In-flight and finished reference snapshots, by (project_id, page_id, content hash)
+_reference_computed_css = {}
+
+async def get_reference_computed_css(project_id: str, page_id: str, config: Config = None):
+    """
+    Computed styles of the reference page, cached in memory and in
+    `generated/reference.computed_values.json`.
+
+    The cache is keyed by page_content_hash, so editing the page, global.css or
+    config.json invalidates it. Concurrent callers share a single render.
+    """
+    key = (project_id, page_id, page_content_hash(project_id, page_id))
+
+    task = _reference_computed_css.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_load_reference_computed_css(*key, config))
+        _reference_computed_css[key] = task
+
+    try:
+        return await task
+    except Exception:
+        # Don't cache failures
+        _reference_computed_css.pop(key, None)
+        raise
+
+async def _load_reference_computed_css(project_id, page_id, content_hash, config):
+    cache_path = os.path.join("data", project_id, "pages", page_id, "generated", "reference.computed_values.json")
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("hash") == content_hash:
+                return cached["computed_values"]
+        except (json.JSONDecodeError, KeyError):
+            pass
+
+    if config is None:
+        config = load_config(project_id, page_id)
+
+    reference_html = generate_html(project_id, page_id, config.correct_css)
+    computed_values = await get_computed_css(f"{project_id}/pages/{page_id}/generated/reference.html", html=reference_html)
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump({"hash": content_hash, "computed_values": computed_values}, f, indent=2)
+
+    return computed_values
+
+
+# In-flight and finished renders of corrected pages, by (project_id, page_id, stylesheet fingerprint)
+_corrected_renders = {}
+
+async def render_corrected_page(project_id: str, page_id: str, corrected_css: LayeredStyleSheet, path: str, html: str):
+    """
+    Render a model-corrected page under `path` (screenshot included) and return its computed styles.
+
+    Pages are deduplicated by the fingerprint of their stylesheet: when several
+    models return the same corrections, the page is rendered once and the
+    others get a copy of its screenshot.
+    """
+    key = (project_id, page_id, corrected_css.fingerprint())
+
+    entry = _corrected_renders.get(key)
+    if entry is None:
+        entry = (path, asyncio.ensure_future(_render_corrected_page(path, html)))
+        _corrected_renders[key] = entry
+
+    rendered_path, task = entry
+    try:
+        computed_values = await task
+    except Exception:
+        # Don't cache failures
+        _corrected_renders.pop(key, None)
+        raise
+
+    if rendered_path != path:
+        screenshot_path = os.path.join("data", f"{os.path.splitext(path)[0]}.png")
+        os.makedirs(os.path.dirname(screenshot_path), exist_ok=True)
+        shutil.copyfile(os.path.join("data", f"{os.path.splitext(rendered_path)[0]}.png"), screenshot_path)
+
+    return computed_values
+
+async def get_corrected_computed_css(project_id: str, page_id: str, corrected_css: LayeredStyleSheet, path: str, html: str, render=True):
+    """
+    Computed styles of a corrected page, stored in `computed_values.json` next
+    to `path` under the stylesheet fingerprint and page_content_hash.
+
+    With `render`, the page is rendered (screenshot included, see
+    render_corrected_page) and the stored values refreshed. Without it, the
+    stored values are used while they match and the page is only loaded to
+    compute styles when they don't.
+    """
+    cache_path = os.path.join("data", os.path.dirname(path), "computed_values.json")
+    key = {"fingerprint": corrected_css.fingerprint(), "page_hash": page_content_hash(project_id, page_id)}
+
+    if not render and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("key") == key:
+                return cached["computed_values"]
+        except (json.JSONDecodeError, KeyError):
+            pass
+
+    if render:
+        computed_values = await render_corrected_page(project_id, page_id, corrected_css, path, html)
+    else:
+        computed_values = await get_computed_css(path, html=html)
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "computed_values": computed_values}, f, indent=2)
+
+    return computed_values
+
+async def _render_corrected_page(path, html):
+    await render_html(path, html=html)
+    return await get_computed_css(path, html=html)
+
+
+# Opening tag of the page styles block, e.g. <style id="page-styles">
+PAGE_STYLES_TAG = re.compile(r"""<style\b[^>]*?\bid\s*=\s*(?:"page-styles"|'page-styles'|page-styles(?=[\s/>]))[^>]*>""", re.IGNORECASE)
+STYLE_END_TAG = re.compile(r"</style\s*>", re.IGNORECASE)
+
+CSS_TOKEN = re.compile(r"""
+    (?P<comment>/\*.*?(?:\*/|\Z))
+  | (?P<string>"(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?)
+  | (?P<escape>\\.)
+  | (?P<open>\{)
+  | (?P<close>\})
+  | (?P<semicolon>;)
+  | (?P<paren>[()])
+  | (?P<text>[^{};()"'\\/]+|/)
+""", re.DOTALL | re.VERBOSE)
+
+# At-rules whose blocks contain regular rules, which are read as if they were top level
+NESTED_AT_RULES = {"media", "supports", "document", "layer", "container", "scope"}
+
+
+def _parse_declarations(tokens, i, properties):
+    # Reads `name: value` pairs until the block's closing brace, returns the index after it
+    current = []
+    depth = 0
+
+    def flush():
+        declaration = "".join(current).strip()
+        current.clear()
+        if ":" in declaration:
+            key, value = declaration.split(":", 1)
+            properties[key.strip()] = value.strip()
+
+    while i < len(tokens):
+        kind, value = tokens[i]
+        i += 1
+
+        if kind == "comment":
             continue
-        
-        # Parse properties
+        if kind == "close" and depth == 0:
+            break
+        if kind == "semicolon" and depth == 0:
+            flush()
+            continue
+
+        # Semicolons in parentheses or nested blocks (e.g. inside url(...)) don't end a declaration
+        if kind == "open" or value == "(":
+            depth += 1
+        elif (kind == "close" or value == ")") and depth > 0:
+            depth -= 1
+        current.append(value)
+
+    flush()
+    return i
+
+
+def _skip_block(tokens, i):
+    depth = 1
+    while i < len(tokens) and depth:
+        kind = tokens[i][0]
+        if kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth -= 1
+        i += 1
+    return i
+
+
+def _parse_rules(tokens, i, stylesheet, nested=False):
+    # Reads rules until the end of the stylesheet (or of a nested at-rule block), returns the index after it
+    prelude = []
+
+    while i < len(tokens):
+        kind, value = tokens[i]
+        i += 1
+
+        if kind == "comment":
+            continue
+
+        if kind == "close":
+            if nested:
+                return i
+            # Stray closing brace, drop whatever came before it
+            prelude.clear()
+            continue
+
+        if kind == "semicolon" and "".join(prelude).lstrip().startswith("@"):
+            # At-rule statement such as @import or @charset
+            prelude.clear()
+            continue
+
+        if kind != "open":
+            prelude.append(value)
+            continue
+
+        selector = "".join(prelude).strip()
+        prelude.clear()
+
+        if selector.startswith("@"):
+            at_rule = re.match(r"@([-\w]+)", selector)
+            if at_rule and at_rule.group(1).lower() in NESTED_AT_RULES:
+                i = _parse_rules(tokens, i, stylesheet, nested=True)
+            else:
+                # Blocks of declarations or keyframes (@font-face, @keyframes, ...) aren't selectors
+                i = _skip_block(tokens, i)
+            continue
+
         properties = {}
-        for prop in properties_text.split(';'):
-            prop = prop.strip()
-            if not prop:
-                continue
-            
-            try:
-                key, value = prop.split(':', 1)
-                properties[key.strip()] = value.strip()
-            except ValueError:
-                # Skip malformed properties
-                continue
-        
-        stylesheet[selector] = properties
-    
+        i = _parse_declarations(tokens, i, properties)
+
+        # Skip if selector is empty
+        if selector:
+            stylesheet[selector] = properties
+
+    return i
+
+
+def parse_css(css_text: str) -> StyleSheet:
+    """
+    Parse CSS rules into a StyleSheet in a single tokenizing pass.
+
+    Comments, strings and parentheses are respected, rules inside @media-like
+    at-rules are read as top level rules and other at-rules are skipped. A
+    selector that appears twice keeps its last block.
+    """
+    tokens = [(match.lastgroup, match.group()) for match in CSS_TOKEN.finditer(css_text)]
+    stylesheet: StyleSheet = {}
+    _parse_rules(tokens, 0, stylesheet)
     return stylesheet
 
 
+def read_page_styles(html_content) -> StyleSheet:
+    # Find the page-styles stylesheet without parsing the whole document
+    start_tag = PAGE_STYLES_TAG.search(html_content)
+    if not start_tag:
+        return {}  # Return empty stylesheet if not found
+
+    end_tag = STYLE_END_TAG.search(html_content, start_tag.end())
+    css_text = html_content[start_tag.end():end_tag.start() if end_tag else len(html_content)]
+
+    return parse_css(css_text)
+
+
+# Validated configs by (project_id, page_id), with the file versions they were loaded from
+_configs = {}
+
 def load_config(project_id: str, page_id: str) -> Config:
     """
     Load and validate configuration for a specific project and page.
+
+    Configs are memoized and only reloaded when page.html or config.json
+    change (by mtime and size). The returned object is shared, don't modify it.
     
     Args:
         project_id (str): The ID of the project
@@ -308,6 +775,14 @@ def load_config(project_id: str, page_id: str) -> Config:
     # Construct paths
     html_path = os.path.join('data', project_id, 'pages', page_id, 'page.html')
     config_path = os.path.join('data', project_id, 'pages', page_id, 'config.json')
+
+    html_stat = os.stat(html_path)
+    config_stat = os.stat(config_path)
+    version = (html_stat.st_mtime_ns, html_stat.st_size, config_stat.st_mtime_ns, config_stat.st_size)
+
+    cached = _configs.get((project_id, page_id))
+    if cached and cached[0] == version:
+        return cached[1]
     
     # Read HTML file
     with open(html_path, 'r') as f:
@@ -324,9 +799,17 @@ def load_config(project_id: str, page_id: str) -> Config:
     config_data['correct_css'] = stylesheet
     
     # Validate and return config
-    return Config.model_validate(config_data)
+    config = Config.model_validate(config_data)
+    _configs[(project_id, page_id)] = (version, config)
+    return config
+
+def prompt_content_to_html(content, image_links=None):
+    """
+    Readable HTML snapshot of a prompt. Images whose data URL is in
+    `image_links` are linked by the given src instead of being inlined.
+    """
+    image_links = image_links or {}
 
-def prompt_content_to_html(content):
     prompt_html = f"""<!DOCTYPE html>
 <html>
 <head>
@@ -347,7 +830,7 @@ def prompt_content_to_html(content):
         elif item["type"] == "image_url":
             prompt_html += f"""
 <div class="message">
-    <img src="{item["image_url"]["url"]}" />
+    <img src="{image_links.get(item["image_url"]["url"], item["image_url"]["url"])}" />
 </div>"""
 
     prompt_html += """
@@ -357,30 +840,157 @@ def prompt_content_to_html(content):
     return prompt_html
 
 
+PROMPT_HASH_PREFIX = "<!-- prompt-hash: "
 
-async def call_openrouter_with_retry(messages, model, response_format, max_retries=5, timeout=10, name=None):
-    try:
-        client = openai.AsyncOpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            max_retries=max_retries, 
-            timeout=timeout
-        )
+def write_prompt_html(output_path, content, image_paths):
+    """
+    Write the prompt snapshot to `output_path`, linking images by their path
+    relative to it (`image_paths` maps data URLs to files).
 
-        completion = await client.chat.completions.create(
-            model=model,
-            messages=messages,
-            name=name
+    The hash of the snapshot is kept on the first line, so an unchanged prompt
+    isn't rewritten. Returns True if the file was written.
+    """
+    output_dir = os.path.dirname(output_path)
+    image_links = {url: os.path.relpath(path, output_dir) for url, path in image_paths.items()}
+    prompt_html = prompt_content_to_html(content, image_links)
+    header = f"{PROMPT_HASH_PREFIX}{hashlib.sha256(prompt_html.encode('utf-8')).hexdigest()} -->\n"
+
+    if os.path.exists(output_path):
+        with open(output_path, "r", encoding="utf-8") as f:
+            if f.readline() == header:
+                return False
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(header + prompt_html)
+    return True
+
+
+
+OPENROUTER_BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+OPENROUTER_MAX_CONNECTIONS = int(os.environ.get("OPENROUTER_MAX_CONNECTIONS", "20"))
+OPENROUTER_KEEPALIVE_EXPIRY = 120
+
+# Clients are shared by all calls to the same base URL, so connections are kept
+# alive and reused instead of opening a new pool (and TLS handshake) per eval
+_openrouter_clients = {}
+
+# Latency of the request in flight in the current task, filled in by the hooks below
+_request_latency = contextvars.ContextVar("request_latency", default=None)
+
+openrouter_stats = {"requests": 0, "connections": 0}
+
+async def _trace_request(event_name, info):
+    latency = _request_latency.get()
+    if event_name == "connection.connect_tcp.started":
+        openrouter_stats["connections"] += 1
+    if latency is None or "queue_wait" in latency:
+        return
+    # The first connection event happens once the pool handed out a connection
+    # (new or kept alive), everything before it was waiting for one
+    if event_name.startswith("connection.") or event_name.endswith("send_request_headers.started"):
+        latency["queue_wait"] = time.perf_counter() - latency["attempt_start"]
+
+async def _on_request(request):
+    openrouter_stats["requests"] += 1
+    latency = _request_latency.get()
+    if latency is not None:
+        latency["attempts"] += 1
+        latency["attempt_start"] = time.perf_counter()
+        latency.pop("queue_wait", None)
+        latency.pop("ttfb", None)
+    request.extensions["trace"] = _trace_request
+
+async def _on_response(response):
+    latency = _request_latency.get()
+    if latency is not None:
+        # Response hooks run once the headers arrived, before the body is read
+        latency["ttfb"] = time.perf_counter() - latency["attempt_start"]
+
+def get_openrouter_client(base_url=None, max_connections=None):
+    """Shared AsyncOpenAI client for `base_url`, with a bounded keep-alive connection pool"""
+    base_url = base_url or OPENROUTER_BASE_URL
+    if base_url not in _openrouter_clients:
+        max_connections = max_connections or OPENROUTER_MAX_CONNECTIONS
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=OPENROUTER_KEEPALIVE_EXPIRY,
+            ),
+            event_hooks={"request": [_on_request], "response": [_on_response]},
         )
+        _openrouter_clients[base_url] = openai.AsyncOpenAI(base_url=base_url, http_client=http_client)
+    return _openrouter_clients[base_url]
+
+async def close_openrouter_clients():
+    for client in _openrouter_clients.values():
+        await client.close()
+    _openrouter_clients.clear()
 
-        content = completion.choices[0].message.content
+def print_openrouter_stats():
+    if openrouter_stats["requests"]:
+        print(f"[openrouter] requests: {openrouter_stats['requests']}, connections opened: {openrouter_stats['connections']}")
+
+async def call_openrouter_with_retry(messages, model, response_format, max_retries=5, timeout=10, name=None, budget=None):
+    """
+    Call the model and parse its reply into `response_format`.
+
+    Returns {"content": ...} or {"error": ..., "message": ...}, both with the
+    "latency" of the call in seconds: queue_wait (waiting for a pooled
+    connection) and ttfb (until response headers) of the last attempt, and
+    total of the whole call including retries.
+
+    Replies are stored in the response cache, so a prompt already sent to
+    the model is answered from disk (reported with "cached" in latency).
+    The model's `budget` (a ModelBudget or a scheduler's BudgetLease) is
+    only spent when the model is actually called.
+    """
+    latency = {"attempts": 0, "attempt_start": time.perf_counter()}
+    cached = False
+    token = _request_latency.set(latency)
+    start = time.perf_counter()
+
+    def latency_report():
+        report = {key: round(latency[key], 4) for key in ("queue_wait", "ttfb") if key in latency}
+        report["total"] = round(time.perf_counter() - start, 4)
+        report["attempts"] = latency["attempts"]
+        if cached:
+            report["cached"] = True
+        return report
+
+    try:
+        # Replies to prompts sent before come from the response cache
+        content = response_cache.get(model, messages, OPENROUTER_BASE_URL)
+        cached = content is not None
+
+        if cached:
+            if budget is not None:
+                budget.cancel()
+        else:
+            if budget is not None:
+                await budget.spend(sum(estimate_prompt_tokens(message["content"]) for message in messages))
+
+            client = get_openrouter_client().with_options(max_retries=max_retries, timeout=timeout)
+
+            completion = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                name=name
+            )
+
+            content = completion.choices[0].message.content
+            response_cache.put(model, messages, OPENROUTER_BASE_URL, content)
 
         try:
             response_object = response_format.model_validate(extract_json_from_response(content))
         except Exception as e:
-            return {"error": "json_format_error", "message": str(e)}
+            return {"error": "json_format_error", "message": str(e), "latency": latency_report()}
 
-        return { "content": response_object }
+        return { "content": response_object, "latency": latency_report() }
 
     except Exception as e:
-        return {"error": "api_error", "message": str(e)}
+        return {"error": "api_error", "message": str(e), "latency": latency_report()}
+    finally:
+        _request_latency.reset(token)
 